@@ -0,0 +1,155 @@
+import hashlib
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import metrics
+
+FFMPEG = "ffmpeg"  # ffmpeg executable (must be on PATH)
+WAV_CODEC = "pcm_s16le"  # what pydub's MP3 import + WAV export produced
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+HEADER_READ_LIMIT = 1024 * 1024  # give up looking for the data chunk after this many bytes
+
+# Parsed WAV header; data_offset/data_size locate the PCM bytes in the file
+WavInfo = namedtuple("WavInfo", ["format_tag", "channels", "sample_rate", "bits", "block_align",
+                                 "frames", "data_offset", "data_size"])
+
+
+class WavFormatError(Exception):
+    """Raised when a file is not a WAV we can read."""
+
+
+@contextmanager
+def atomic_output(path):
+    """
+    Yield a temporary path next to `path`; it is renamed over `path` only if the
+    block exits cleanly, and removed otherwise. Readers never see a half-written file.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.part")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@metrics.timed("decode_seconds")
+def decode_mp3_stream(chunks, output_wav, ffmpeg=FFMPEG):
+    """
+    Decode an iterable of MP3 byte chunks straight into a WAV file.
+
+    The chunks are piped into ffmpeg as they arrive, so the response is never
+    joined in memory and no intermediate .mp3 is written. The WAV appears
+    atomically; on any failure (including an error raised by the chunk
+    iterator itself) the decoder is killed and nothing is left behind.
+
+    Args:
+        chunks: Iterable of bytes, e.g. the generator returned by text_to_sound_effects.convert.
+        output_wav (str): Path of the WAV file to create.
+        ffmpeg (str): ffmpeg executable.
+
+    Returns:
+        int: Number of MP3 bytes consumed.
+    """
+    consumed = 0
+    with atomic_output(output_wav) as tmp_path, tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(
+            [ffmpeg, "-hide_banner", "-loglevel", "error", "-f", "mp3", "-i", "pipe:0",
+             "-acodec", WAV_CODEC, "-f", "wav", "-y", tmp_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr
+        )
+        try:
+            try:
+                for chunk in chunks:
+                    proc.stdin.write(chunk)
+                    consumed += len(chunk)
+            except BrokenPipeError:
+                pass  # ffmpeg exited early; its return code and stderr say why
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+            returncode = proc.wait()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        if returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode("utf-8", "replace").strip()
+            raise RuntimeError(f"ffmpeg failed decoding {output_wav} (exit {returncode}): {message}")
+    metrics.inc("decode_bytes", consumed)
+    return consumed
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@metrics.timed("wav_header_scan_seconds")
+def read_wav_info(path):
+    """
+    Read a WAV file's format and data location from its RIFF header without
+    touching the audio. Handles PCM, IEEE float and WAVE_FORMAT_EXTENSIBLE,
+    and tolerates data sizes that overrun the file (streamed or truncated writes).
+
+    Raises:
+        WavFormatError: If the file is not a readable RIFF/WAVE file.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise WavFormatError(f"{path}: not a RIFF/WAVE file")
+        fmt = None
+        offset = 12
+        while offset < HEADER_READ_LIMIT:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                break
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk)
+            offset += 8
+            if chunk_id == b"fmt ":
+                body = f.read(chunk_size)
+                if len(body) < 16:
+                    raise WavFormatError(f"{path}: short fmt chunk")
+                format_tag, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", body[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    format_tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (format_tag, channels, sample_rate, bits, block_align)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise WavFormatError(f"{path}: data chunk before fmt chunk")
+                format_tag, channels, sample_rate, bits, block_align = fmt
+                if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT) or not block_align:
+                    raise WavFormatError(f"{path}: unsupported format tag {format_tag:#x}")
+                data_size = min(chunk_size, file_size - offset)
+                data_size -= data_size % block_align
+                return WavInfo(format_tag, channels, sample_rate, bits, block_align,
+                               data_size // block_align, offset, data_size)
+            else:
+                f.seek(chunk_size, os.SEEK_CUR)
+            # Chunks are word aligned
+            if chunk_size % 2:
+                f.seek(1, os.SEEK_CUR)
+                offset += 1
+            offset += chunk_size
+    raise WavFormatError(f"{path}: no data chunk found")
@@ -0,0 +1,329 @@
+import random
+from collections import deque
+
+BANK_SIZE = 8  # zones per channel
+BANKS_PER_PRESET = 8  # channels per preset
+
+
+class AssignmentError(Exception):
+    """Raised in strict mode when the constraints cannot be satisfied."""
+
+
+class IndexedPool:
+    """
+    Unordered set with O(1) add, discard and uniform random draw
+    (a list plus a position map; removal swaps with the last element).
+    """
+
+    __slots__ = ("_items", "_pos")
+
+    def __init__(self, items=()):
+        self._items = []
+        self._pos = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._pos
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def add(self, item):
+        if item not in self._pos:
+            self._pos[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item):
+        pos = self._pos.pop(item, None)
+        if pos is None:
+            return
+        last = self._items.pop()
+        if pos < len(self._items):
+            self._items[pos] = last
+            self._pos[last] = pos
+
+    def choice(self, rng):
+        return self._items[rng.randrange(len(self._items))]
+
+    def pop_random(self, rng):
+        item = self.choice(rng)
+        self.discard(item)
+        return item
+
+
+class BankAssigner:
+    """
+    Draws banks of samples for presets without replacement, in O(1) per pick.
+
+    Every bank is drawn from a single group (e.g. samples with the same frame
+    length), and a sample never appears twice in a bank. On top of that:
+
+    Args:
+        groups: {group_key: [sample, ...]}, or a plain list to treat all samples as one group.
+        bank_size (int): Samples per bank (zones per channel).
+        banks_per_preset (int): Banks per preset (channels).
+        distinct_groups (bool): Draw each bank of a preset from a different group.
+        unique_across: A sample used in a preset is unavailable for this many presets
+            (1 = unique within a preset, None = never reused while unused samples remain,
+            0 = unique within a bank only).
+        max_reuse (int): Retire a sample after this many uses (None = no limit).
+        conflicts: Optional callable (sample, bank_so_far) -> bool rejecting a candidate.
+        strict (bool): Raise AssignmentError instead of relaxing constraints when stuck.
+        rng: random.Random instance (defaults to a freshly seeded one).
+    """
+
+    def __init__(self, groups, bank_size=BANK_SIZE, banks_per_preset=BANKS_PER_PRESET,
+                 distinct_groups=False, unique_across=1, max_reuse=None, conflicts=None,
+                 strict=False, rng=None):
+        if not isinstance(groups, dict):
+            groups = {None: list(groups)}
+        self.groups = {key: list(dict.fromkeys(members)) for key, members in groups.items() if members}
+        self.bank_size = bank_size
+        self.banks_per_preset = banks_per_preset
+        self.distinct_groups = distinct_groups
+        self.unique_across = unique_across
+        self.max_reuse = max_reuse
+        self.conflicts = conflicts
+        self.strict = strict
+        self.rng = rng if rng is not None else random.Random()
+        self.uses = {}
+        self.relaxed = 0  # banks drawn with relaxed constraints
+
+        self._group_of = {}
+        self._available = {}
+        self._eligible = IndexedPool()
+        for key, members in self.groups.items():
+            for sample in members:
+                self._group_of.setdefault(sample, key)
+            self._available[key] = IndexedPool(s for s in members if self._group_of[s] == key)
+            self._update_eligibility(key)
+        self._cooldown = deque()  # samples used by recent presets, oldest first
+        self._warned = False
+
+    @property
+    def total_samples(self):
+        return len(self._group_of)
+
+    def add(self, sample, group=None):
+        """Add a new sample to a group (created on demand) so later presets can draw it."""
+        if sample in self._group_of:
+            return
+        self.groups.setdefault(group, []).append(sample)
+        self._group_of[sample] = group
+        self._available.setdefault(group, IndexedPool()).add(sample)
+        self._update_eligibility(group)
+
+    def remove(self, sample):
+        """Take a sample out of its group (e.g. deleted from the library); presets drawn later never get it."""
+        if sample not in self._group_of:
+            return
+        key = self._group_of.pop(sample)
+        self.groups[key].remove(sample)
+        if not self.groups[key]:
+            del self.groups[key]
+        self._available[key].discard(sample)
+        self._update_eligibility(key)
+        self.uses.pop(sample, None)
+
+    def can_fill(self):
+        """True if the next preset can be drawn from unused samples without relaxing any constraint."""
+        if self.distinct_groups:
+            return len(self._eligible) >= self.banks_per_preset
+        banks = sum(len(self._available[key]) // self.bank_size for key in self._eligible)
+        return banks >= self.banks_per_preset
+
+    def _update_eligibility(self, key):
+        if len(self._available[key]) >= self.bank_size:
+            self._eligible.add(key)
+        else:
+            self._eligible.discard(key)
+
+    def _release(self, samples):
+        touched = set()
+        for sample in samples:
+            if sample not in self._group_of:
+                continue  # removed while cooling down
+            if self.max_reuse is not None and self.uses.get(sample, 0) >= self.max_reuse:
+                continue  # retired
+            key = self._group_of[sample]
+            self._available[key].add(sample)
+            touched.add(key)
+        for key in touched:
+            self._update_eligibility(key)
+
+    def _recycle(self):
+        while self._cooldown:
+            self._release(self._cooldown.popleft())
+
+    def _draw(self, key, used):
+        pool = self._available[key]
+        bank = []
+        rejected = []
+        while len(bank) < self.bank_size and pool:
+            sample = pool.pop_random(self.rng)
+            if self.conflicts is not None and self.conflicts(sample, bank):
+                rejected.append(sample)
+                continue
+            bank.append(sample)
+        for sample in rejected:
+            pool.add(sample)
+        if len(bank) < self.bank_size:
+            for sample in bank:
+                pool.add(sample)
+            self._update_eligibility(key)
+            return None
+        self._update_eligibility(key)
+        used.extend(bank)
+        return bank
+
+    def _fallback_bank(self, taken):
+        if self.strict:
+            raise AssignmentError("Not enough unused samples to fill a bank under the current constraints.")
+        if not self._warned:
+            print("Warning: Not enough unique samples for the requested constraints. Duplicates will occur.")
+            self._warned = True
+        self.relaxed += 1
+        return self._relaxed_bank(taken, self.rng)
+
+    def _relaxed_bank(self, taken, rng):
+        # Constraints cannot be met: draw from the largest group regardless of
+        # availability, repeating samples if the group is smaller than a bank.
+        candidates = [key for key in self.groups if key not in taken] or list(self.groups)
+        key = max(candidates, key=lambda k: len(self.groups[k]))
+        members = self.groups[key].copy()
+        rng.shuffle(members)
+        while len(members) < self.bank_size:
+            members.extend(members[:self.bank_size - len(members)])
+        return key, members[:self.bank_size]
+
+    def assign_bank(self, used, taken):
+        """Draw one bank, skipping groups in `taken`. Returns (group_key, bank)."""
+        for recycled in (False, True):
+            if recycled:
+                self._recycle()
+            # Groups already taken by this preset are set aside so picks stay O(1)
+            parked = [key for key in taken if key in self._eligible] if self.distinct_groups else []
+            for key in parked:
+                self._eligible.discard(key)
+            try:
+                attempts = len(self._eligible)
+                while attempts > 0 and self._eligible:
+                    key = self._eligible.choice(self.rng)
+                    bank = self._draw(key, used)
+                    if bank is not None:
+                        return key, bank
+                    attempts -= 1
+            finally:
+                for key in parked:
+                    self._update_eligibility(key)
+        return self._fallback_bank(taken)
+
+    def assign_preset(self):
+        """
+        Draw the banks for the next preset.
+
+        Returns:
+            list: One list of samples per bank.
+        """
+        if self.unique_across is not None:
+            while self._cooldown and len(self._cooldown) >= max(self.unique_across, 1):
+                self._release(self._cooldown.popleft())
+
+        used = []
+        taken = set()
+        banks = []
+        for _ in range(self.banks_per_preset):
+            key, bank = self.assign_bank(used, taken)
+            taken.add(key)
+            banks.append(bank)
+            for sample in bank:
+                self.uses[sample] = self.uses.get(sample, 0) + 1
+            if self.unique_across == 0:
+                self._release(bank)
+        if self.unique_across != 0:
+            self._cooldown.append(used)
+        return banks
+
+    def sample_preset(self, rng):
+        """
+        Draw the banks for one preset from the current pools with `rng`,
+        without changing the assigner. The preset's picks are kept in a small
+        exclusion set instead of being taken out of the pools, so a draw costs
+        a few O(1) picks per zone however large the library is. Every draw
+        depends only on the assigner's state and `rng`; cooldown and use
+        counts are neither applied between draws nor updated.
+
+        Returns:
+            (list, int): One list of samples per bank, and how many banks were
+            drawn with relaxed constraints.
+        """
+        excluded = set()
+        taken = set()
+        banks = []
+        relaxed = 0
+        for _ in range(self.banks_per_preset):
+            key, bank = self._sample_bank(rng, excluded, taken)
+            if bank is None:
+                if self.strict:
+                    raise AssignmentError("Not enough unused samples to fill a bank under the current constraints.")
+                key, bank = self._relaxed_bank(taken, rng)
+                relaxed += 1
+            taken.add(key)
+            if self.unique_across != 0:
+                excluded.update(bank)
+            banks.append(bank)
+        return banks, relaxed
+
+    def _sample_bank(self, rng, excluded, taken):
+        tried = set(taken) if self.distinct_groups else set()
+        # A few O(1) random picks first; a pass over the remaining groups only if they keep failing
+        for _ in range(2 * self.banks_per_preset):
+            if not self._eligible:
+                break
+            key = self._eligible.choice(rng)
+            if key in tried:
+                continue
+            tried.add(key)
+            bank = self._sample_from(key, rng, excluded)
+            if bank is not None:
+                return key, bank
+        rest = [key for key in self._eligible if key not in tried]
+        rng.shuffle(rest)
+        for key in rest:
+            bank = self._sample_from(key, rng, excluded)
+            if bank is not None:
+                return key, bank
+        return None, None
+
+    def _sample_from(self, key, rng, excluded):
+        pool = self._available[key]
+        if len(pool) - sum(1 for sample in excluded if sample in pool) < self.bank_size:
+            return None
+        bank = []
+        skip = set(excluded)
+        for _ in range(4 * self.bank_size):
+            if len(bank) == self.bank_size:
+                return bank
+            sample = pool.choice(rng)
+            if sample in skip:
+                continue
+            skip.add(sample)
+            if self.conflicts is None or not self.conflicts(sample, bank):
+                bank.append(sample)
+        if len(bank) < self.bank_size:
+            # Rejection keeps missing (a nearly used-up pool or many conflicts): go through the rest in random order
+            rest = [sample for sample in pool if sample not in skip]
+            rng.shuffle(rest)
+            for sample in rest:
+                if len(bank) == self.bank_size:
+                    break
+                if self.conflicts is None or not self.conflicts(sample, bank):
+                    bank.append(sample)
+        return bank if len(bank) == self.bank_size else None
+
+    def assign(self, num_presets):
+        return [self.assign_preset() for _ in range(num_presets)]
@@ -0,0 +1,341 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+import metrics
+from audioio import FFMPEG, decode_mp3_stream, read_wav_info
+from bankassign import BankAssigner
+from mp3towavscript import convert_file
+from pcm import wav_header
+from presetio import dumps_preset, read_preset, yaml_dump_preset
+from sampleindex import SampleIndex
+from soundgen import FakeSoundClient, GenerationJob, SoundGenerator
+from stripSilence import strip_silence
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ("header_scan", "bank_selection", "yaml_dump", "preset_emit", "strip_silence",
+          "mp3_convert", "generate_decode")
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # macOS reports bytes, Linux KiB
+
+
+def _reset_peak_rss():
+    # Linux lets a process restart its own peak RSS ("VmHWM") by writing 5 to clear_refs
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _hwm_bytes():
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def begin_rss():
+    """Start measuring a stage's memory; pass the result to rss_fields() once the stage is done."""
+    if _reset_peak_rss():
+        return True, None
+    return False, peak_rss_bytes()
+
+
+def rss_fields(mark):
+    """
+    The stage's own peak RSS where it can be isolated (Linux), otherwise how
+    far it raised the process-wide peak (0 when an earlier stage peaked higher).
+    """
+    isolated, before = mark
+    if isolated:
+        return {"stage_peak_rss_bytes": _hwm_bytes()}
+    after = peak_rss_bytes()
+    return {"peak_rss_growth_bytes": after - before} if after is not None else {}
+
+
+def summarize(latencies, total_seconds):
+    latencies_ms = np.asarray(latencies, dtype=np.float64) * 1e3
+    return {
+        "items": len(latencies),
+        "total_s": round(total_seconds, 6),
+        "throughput_per_s": round(len(latencies) / total_seconds, 3) if total_seconds > 0 else None,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 4) if len(latencies) else None,
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 4) if len(latencies) else None,
+    }
+
+
+def time_each(func, items):
+    """Call func(item) for every item; returns (per-item latencies, total seconds)."""
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - start
+
+
+def synth_signal(rng, frames, channels, sample_rate, lead_frames, tail_frames):
+    """A decaying tone plus noise, framed by low-level noise standing in for silence."""
+    t = np.arange(frames) / sample_rate
+    tone = 0.5 * np.sin(2 * np.pi * rng.uniform(80, 2000) * t) * np.exp(-t * rng.uniform(0.2, 3))
+    body = tone[:, None] + rng.normal(0, 0.02, (frames, channels))
+    quiet = lambda n: rng.normal(0, 1e-4, (n, channels))
+    return np.clip(np.concatenate([quiet(lead_frames), body, quiet(tail_frames)]), -1, 1)
+
+
+def encode_pcm(signal, bits):
+    if bits == 8:
+        return np.round(signal * 127 + 128).astype(np.uint8).tobytes()
+    if bits == 16:
+        return np.round(signal * 32767).astype("<i2").tobytes()
+    if bits == 24:
+        values = np.round(signal * (2 ** 23 - 1)).astype("<i4")
+        return values.reshape(-1, 1).view(np.uint8)[:, :3].tobytes()
+    if bits == 32:
+        return signal.astype("<f4").tobytes()
+    raise ValueError(f"Unsupported bit depth: {bits}")
+
+
+def synth_wav_corpus(directory, count, seconds=(1.0, 2.0, 4.0), sample_rate=44100, bits=16,
+                     channels=1, silence=0.3, seed=0):
+    """
+    Write `count` synthetic WAVs cycling through `seconds` lengths (so the same-length
+    grouping has something to group) with up to `silence` seconds of quiet at each end.
+    32-bit output is IEEE float; other depths are integer PCM.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    format_tag = 3 if bits == 32 else 1
+    names = []
+    for i in range(count):
+        frames = int(seconds[i % len(seconds)] * sample_rate)
+        lead, tail = (int(rng.uniform(0, silence) * sample_rate) for _ in range(2))
+        data = encode_pcm(synth_signal(rng, frames, channels, sample_rate, lead, tail), bits)
+        name = f"synth_{i:06d}.wav"
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(wav_header(format_tag, channels, sample_rate, bits, len(data)))
+            f.write(data)
+        names.append(name)
+    return names
+
+
+def encode_mp3(wav_path, mp3_path):
+    subprocess.run([FFMPEG, "-hide_banner", "-loglevel", "error", "-i", wav_path, "-y", mp3_path],
+                   check=True, capture_output=True)
+
+
+def synth_mp3_corpus(directory, count, seconds=2.0, sample_rate=44100, channels=1, variants=4, seed=0):
+    """Encode a few distinct MP3s with ffmpeg and copy them round-robin up to `count` files."""
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.TemporaryDirectory() as scratch:
+        sources = []
+        for i, name in enumerate(synth_wav_corpus(scratch, variants, (seconds,), sample_rate, 16,
+                                                  channels, seed=seed)):
+            mp3 = os.path.join(scratch, f"v{i}.mp3")
+            encode_mp3(os.path.join(scratch, name), mp3)
+            sources.append(mp3)
+        names = []
+        for i in range(count):
+            name = f"synth_{i:06d}.mp3"
+            shutil.copyfile(sources[i % len(sources)], os.path.join(directory, name))
+            names.append(name)
+    return names
+
+
+def bench_header_scan(wav_dir, names):
+    latencies, _ = time_each(lambda name: read_wav_info(os.path.join(wav_dir, name)), names)
+    db_path = os.path.join(wav_dir, "..", "bench_index.sqlite")
+    start = time.perf_counter()
+    with SampleIndex(wav_dir, db_path) as index:
+        index.refresh()
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        index.refresh()
+        warm = time.perf_counter() - start
+    result = summarize(latencies, cold)
+    result.update(cold_refresh_s=round(cold, 6), warm_refresh_s=round(warm, 6))
+    return result
+
+
+def bench_bank_selection(wav_dir, num_presets):
+    with SampleIndex(wav_dir, os.path.join(wav_dir, "..", "bench_index.sqlite")) as index:
+        groups = index.length_groups(min_size=8)
+        samples = index.all_samples()
+    assigner = BankAssigner(groups if len(groups) >= 8 else samples, distinct_groups=len(groups) >= 8,
+                            rng=random.Random(0))
+    latencies, total = time_each(lambda _: assigner.assign_preset(), range(num_presets))
+    return summarize(latencies, total), assigner
+
+
+def synthetic_preset(preset_num, banks, template):
+    preset = {key: value for key, value in template.items() if not isinstance(value, dict)}
+    preset["Name "] = f"Pre{preset_num}"
+    for i, bank in enumerate(banks):
+        channel = dict(template.get(f"Channel {i + 1} ", {}))
+        for j, sample in enumerate(bank):
+            zone_key = f"Zone {j + 1} "
+            channel[zone_key] = dict(channel.get(zone_key, {}), **{"Sample ": sample})
+        preset[f"Channel {i + 1} "] = channel
+    return {f"Preset {preset_num} ": preset}
+
+
+def bench_yaml(presets):
+    return summarize(*time_each(lambda preset: yaml_dump_preset(preset, io.StringIO()), presets))
+
+
+def bench_strip(wav_dir, names, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    return summarize(*time_each(
+        lambda name: strip_silence(os.path.join(wav_dir, name), os.path.join(out_dir, name)), names))
+
+
+def bench_mp3_convert(mp3_dir, names, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    convert = lambda name: convert_file(os.path.join(mp3_dir, name),
+                                        os.path.join(out_dir, os.path.splitext(name)[0] + ".wav"))
+    return summarize(*time_each(convert, names))
+
+
+def bench_generate_decode(mp3_dir, mp3_names, out_dir, jobs, latency, max_in_flight):
+    os.makedirs(out_dir, exist_ok=True)
+    payloads = [open(os.path.join(mp3_dir, name), "rb").read() for name in mp3_names[:4]]
+    client = FakeSoundClient(latency=latency, payload=lambda text, duration: payloads[zlib.crc32(text.encode()) % len(payloads)])
+    generator = SoundGenerator(client, max_in_flight=max_in_flight, requests_per_second=1e6, burst=max_in_flight)
+    latencies = {}
+
+    # The fake client sleeps while its stream is consumed, so this covers API latency plus decode
+    def handle(job, chunks):
+        t0 = time.perf_counter()
+        decode_mp3_stream(chunks, job.output_wav)
+        latencies[job.output_wav] = time.perf_counter() - t0
+
+    work = [GenerationJob(f"benchmark prompt {i}", 2, os.path.join(out_dir, f"gen_{i:05d}.wav"))
+            for i in range(jobs)]
+    start = time.perf_counter()
+    generator.run(work, handle)
+    result = summarize(list(latencies.values()), time.perf_counter() - start)
+    result.update(api_latency_s=latency, max_in_flight=max_in_flight)
+    return result
+
+
+def run(args):
+    stages = set(args.stages or STAGES)
+    have_ffmpeg = shutil.which(FFMPEG) is not None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="a8bench_")
+    wav_dir = os.path.join(workdir, "wav")
+    mp3_dir = os.path.join(workdir, "mp3")
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count(), "ffmpeg": have_ffmpeg},
+        "stages": {},
+    }
+    results = report["stages"]
+    try:
+        names = synth_wav_corpus(wav_dir, args.samples, tuple(args.seconds), args.sample_rate,
+                                 args.bits, args.channels)
+        mp3_names = []
+        if have_ffmpeg and stages & {"mp3_convert", "generate_decode"}:
+            mp3_names = synth_mp3_corpus(mp3_dir, max(args.mp3s, 4), args.seconds[0], args.sample_rate,
+                                         args.channels)
+
+        if stages & {"header_scan", "bank_selection", "yaml_dump", "preset_emit"}:
+            mark = begin_rss()
+            results["header_scan"] = bench_header_scan(wav_dir, names)
+            results["header_scan"].update(rss_fields(mark))
+        presets = []
+        if stages & {"bank_selection", "yaml_dump", "preset_emit"}:
+            mark = begin_rss()
+            results["bank_selection"], assigner = bench_bank_selection(wav_dir, args.presets)
+            results["bank_selection"].update(rss_fields(mark))
+            template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prst001.yml")
+            template = {}
+            if os.path.exists(template_path):
+                template = next(iter(read_preset(template_path).values()))
+            presets = [synthetic_preset(i + 1, assigner.assign_preset(), template) for i in range(args.presets)]
+        if "yaml_dump" in stages:
+            mark = begin_rss()
+            results["yaml_dump"] = bench_yaml(presets)
+            results["yaml_dump"].update(rss_fields(mark))
+        if "preset_emit" in stages:
+            mark = begin_rss()
+            results["preset_emit"] = summarize(*time_each(lambda preset: io.StringIO().write(dumps_preset(preset)),
+                                                          presets))
+            results["preset_emit"].update(rss_fields(mark))
+        if "strip_silence" in stages:
+            mark = begin_rss()
+            results["strip_silence"] = bench_strip(wav_dir, names, os.path.join(workdir, "stripped"))
+            results["strip_silence"].update(rss_fields(mark))
+        for stage in ("mp3_convert", "generate_decode"):
+            if stage in stages and not have_ffmpeg:
+                results[stage] = {"skipped": "ffmpeg not found"}
+        if "mp3_convert" in stages and have_ffmpeg:
+            mark = begin_rss()
+            results["mp3_convert"] = bench_mp3_convert(mp3_dir, mp3_names[:args.mp3s],
+                                                       os.path.join(workdir, "converted"))
+            results["mp3_convert"].update(rss_fields(mark))
+        if "generate_decode" in stages and have_ffmpeg:
+            mark = begin_rss()
+            results["generate_decode"] = bench_generate_decode(mp3_dir, mp3_names, os.path.join(workdir, "generated"),
+                                                               args.jobs, args.latency, args.max_in_flight)
+            results["generate_decode"].update(rss_fields(mark))
+        report["peak_rss_bytes"] = peak_rss_bytes()  # whole run, all stages
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the sample/preset pipeline on synthetic data.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, help="stages to run (default: all)")
+    parser.add_argument("--samples", type=int, default=512, help="synthetic WAV files")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[1.0, 2.0, 4.0], help="WAV lengths to cycle through")
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--bits", type=int, choices=(8, 16, 24, 32), default=16)
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--mp3s", type=int, default=64, help="synthetic MP3 files to convert")
+    parser.add_argument("--presets", type=int, default=200, help="presets for selection/emission")
+    parser.add_argument("--jobs", type=int, default=64, help="fake API generations")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API latency in seconds")
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--workdir", help="keep the corpus here instead of a temp dir")
+    parser.add_argument("--keep", action="store_true", help="do not delete the temp dir")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with metrics.session("benchmark"):
+        report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
@@ -0,0 +1,361 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import metrics
+from audioio import WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, WavFormatError, WavInfo, atomic_output, read_wav_info
+from pcm import copy_frames, from_float, open_pcm, to_float, wav_header
+from presetio import read_preset
+
+# Directories
+SAMPLES_DIR = "/Users/mikesidnam/Desktop/EditedKeepers"
+PRESETS_DIR = "/Users/mikesidnam/Desktop/EditedKeepers"
+CARD_DIR = "/Volumes/ASSIMIL8OR"
+
+# Target sample format (None keeps the source's value)
+TARGET_SAMPLE_RATE = 44100
+TARGET_BITS = 16  # 8, 16 and 24 are integer PCM, 32 is IEEE float
+TARGET_CHANNELS = None  # 1 mixes down to mono, 2 duplicates mono to stereo
+
+# Card constraints
+CARD_CAPACITY = 32 * 1000 ** 3  # bytes
+CLUSTER_SIZE = 32 * 1024  # allocation unit of the card's file system; every file occupies whole clusters
+
+STAGING_DIR = ".cardpack"  # converted samples, relative to the samples directory
+STAGING_MANIFEST = "manifest.json"
+BLOCK_FRAMES = 1 << 18  # output frames resampled per vectorized step
+FILTER_TAPS = 255  # length of the anti-aliasing filter applied before downsampling (odd)
+FILTER_ROLLOFF = 0.95  # its cutoff as a fraction of the target Nyquist frequency
+FILTER_BETA = 8.6  # Kaiser window shape; about 85 dB of stopband attenuation
+COPY_BUFFER = 8 * 1024 * 1024
+
+# What every sample on the card is converted to
+PackFormat = namedtuple("PackFormat", ["sample_rate", "bits", "channels"])
+
+
+def preset_samples(preset_data):
+    """Sample file names referenced by a parsed preset, in channel/zone order."""
+    names = []
+    for preset in preset_data.values():
+        for channel_key, channel in preset.items():
+            if not (channel_key.startswith("Channel ") and isinstance(channel, dict)):
+                continue
+            for zone_key, zone in channel.items():
+                if zone_key.startswith("Zone ") and isinstance(zone, dict) and zone.get("Sample "):
+                    names.append(str(zone["Sample "]))
+    return names
+
+
+def target_info(info, fmt):
+    """Header of `info` once converted to `fmt`."""
+    sample_rate = fmt.sample_rate or info.sample_rate
+    bits = fmt.bits or info.bits
+    channels = fmt.channels or info.channels
+    if fmt.bits == 32:
+        format_tag = WAVE_FORMAT_IEEE_FLOAT
+    elif fmt.bits:
+        format_tag = WAVE_FORMAT_PCM
+    else:
+        format_tag = info.format_tag
+    frames = info.frames * sample_rate // info.sample_rate if info.frames else 0
+    if info.frames and not frames:
+        frames = 1
+    block_align = channels * bits // 8
+    return WavInfo(format_tag, channels, sample_rate, bits, block_align, frames, 44, frames * block_align)
+
+
+def packed_size(info, fmt):
+    """Size in bytes of the converted file (canonical header, data and pad byte)."""
+    data_size = target_info(info, fmt).data_size
+    return 44 + data_size + data_size % 2
+
+
+def allocated(size, cluster_size=CLUSTER_SIZE):
+    """Space a file of `size` bytes takes on the card."""
+    return -(-size // cluster_size) * cluster_size if cluster_size else size
+
+
+def _mix(block, channels):
+    if block.shape[1] == channels:
+        return block
+    if channels == 1:
+        return block.mean(axis=1, keepdims=True)
+    if block.shape[1] == 1:
+        return np.repeat(block, channels, axis=1)
+    return block[:, :channels]
+
+
+def lowpass_kernel(ratio, taps=FILTER_TAPS):
+    """Kaiser-windowed sinc low-pass for resampling by `ratio` (target / source rate < 1), unity gain at DC."""
+    cutoff = 0.5 * ratio * FILTER_ROLLOFF  # cycles per source frame
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff * n) * np.kaiser(taps, FILTER_BETA)
+    return kernel / kernel.sum()
+
+
+def _filter(block, kernel):
+    # Linear convolution along the frames via the FFT, aligned with `block` (the kernel is symmetric)
+    size = len(block) + len(kernel) - 1
+    nfft = 1 << (size - 1).bit_length()
+    spectrum = np.fft.rfft(block, nfft, axis=0) * np.fft.rfft(kernel, nfft)[:, None]
+    half = len(kernel) // 2
+    return np.fft.irfft(spectrum, nfft, axis=0)[half:half + len(block)]
+
+
+@metrics.timed("pack_convert_seconds")
+def convert_sample(input_path, output_path, fmt):
+    """
+    Write `input_path` to `output_path` in format `fmt`.
+
+    Channels are mixed or duplicated, then each block of output frames is
+    linearly interpolated from the source in one vectorized step. When
+    downsampling, the source is first low-passed just below the target
+    Nyquist frequency so content above it does not alias. Files that already
+    match are copied byte for byte.
+
+    Returns:
+        int: Size of the written file in bytes.
+    """
+    info, samples = open_pcm(input_path)
+    out = target_info(info, fmt)
+    if (out.format_tag, out.channels, out.sample_rate, out.bits) == (info.format_tag, info.channels,
+                                                                     info.sample_rate, info.bits):
+        copy_frames(input_path, info, output_path, 0, info.frames)
+        return os.path.getsize(output_path)
+    step = info.sample_rate / out.sample_rate
+    kernel = lowpass_kernel(out.sample_rate / info.sample_rate) if step > 1 else None
+    pad = len(kernel) // 2 if kernel is not None else 0
+    with atomic_output(output_path) as tmp_path:
+        with open(tmp_path, "wb") as dst:
+            dst.write(wav_header(out.format_tag, out.channels, out.sample_rate, out.bits, out.data_size))
+            for pos in range(0, out.frames, BLOCK_FRAMES):
+                position = np.arange(pos, min(out.frames, pos + BLOCK_FRAMES)) * step
+                lo = int(position[0])
+                hi = min(info.frames, int(position[-1]) + 2)
+                if kernel is None:
+                    block = _mix(to_float(samples[lo:hi], info), out.channels)
+                else:
+                    # Filter with `pad` frames of context either side so block edges match a whole-file filter
+                    first, last = max(0, lo - pad), min(info.frames, hi + pad)
+                    block = _mix(to_float(samples[first:last], info), out.channels)
+                    block = _filter(block, kernel)[lo - first:hi - first]
+                if step != 1:
+                    left = np.minimum((position - lo).astype(np.int64), len(block) - 1)
+                    right = np.minimum(left + 1, len(block) - 1)
+                    frac = (position - lo - left)[:, None]
+                    block = block[left] * (1.0 - frac) + block[right] * frac
+                dst.write(from_float(block, out).tobytes())
+            if out.data_size % 2:
+                dst.write(b"\x00")  # RIFF pad byte
+    return os.path.getsize(output_path)
+
+
+def _convert_one(args):
+    name, input_path, output_path, fmt = args
+    try:
+        return name, convert_sample(input_path, output_path, fmt), None
+    except Exception as e:
+        return name, 0, e
+
+
+def plan_card(presets_dir, samples_dir, fmt, cluster_size=CLUSTER_SIZE):
+    """
+    Work out what goes on the card and how much space it takes, without
+    converting or copying anything.
+
+    Samples shared by several zones or presets are stored once. Each preset's
+    footprint counts all of its samples; `exclusive` counts only the ones no
+    other preset uses, i.e. what removing that preset would free.
+
+    Returns:
+        dict: presets (file -> samples/bytes/exclusive), samples (name -> packed
+            bytes), missing and unreadable sample names and the total bytes
+            on the card.
+    """
+    preset_files = sorted(f for f in os.listdir(presets_dir) if f.startswith("prst") and f.endswith(".yml"))
+    used_by = {}
+    presets = {}
+    for preset_file in preset_files:
+        names = list(dict.fromkeys(preset_samples(read_preset(os.path.join(presets_dir, preset_file)))))
+        presets[preset_file] = {"samples": names}
+        for name in names:
+            used_by.setdefault(name, []).append(preset_file)
+
+    samples = {}
+    missing = []
+    unreadable = []
+    for name in sorted(used_by):
+        try:
+            samples[name] = allocated(packed_size(read_wav_info(os.path.join(samples_dir, name)), fmt), cluster_size)
+        except FileNotFoundError:
+            missing.append(name)
+        except WavFormatError:
+            unreadable.append(name)
+
+    for preset_file, entry in presets.items():
+        own = allocated(os.path.getsize(os.path.join(presets_dir, preset_file)), cluster_size)
+        present = [n for n in entry["samples"] if n in samples]
+        entry["bytes"] = own + sum(samples[n] for n in present)
+        entry["exclusive"] = own + sum(samples[n] for n in present if len(used_by[n]) == 1)
+    total = sum(samples.values()) + sum(allocated(os.path.getsize(os.path.join(presets_dir, p)), cluster_size)
+                                        for p in presets)
+    return {"presets": presets, "samples": samples, "missing": missing, "unreadable": unreadable, "total": total}
+
+
+def print_plan(plan, capacity=CARD_CAPACITY):
+    mb = 1000 ** 2
+    for preset_file, entry in plan["presets"].items():
+        print(f"{preset_file}: {len(entry['samples'])} samples, {entry['bytes'] / mb:.1f} MB "
+              f"({entry['exclusive'] / mb:.1f} MB not shared)")
+    listed = sum(len(entry["samples"]) for entry in plan["presets"].values())
+    distinct = len(plan["samples"]) + len(plan["missing"]) + len(plan["unreadable"])
+    print(f"{len(plan['samples'])} distinct samples ({listed - distinct} shared references stored once)")
+    for key, problem in (("missing", "not found"), ("unreadable", "unreadable")):
+        if plan[key]:
+            print(f"Warning: {len(plan[key])} referenced samples {problem}: {', '.join(plan[key][:5])}"
+                  + (" ..." if len(plan[key]) > 5 else ""))
+    print(f"Total: {plan['total'] / mb:.1f} MB of {capacity / mb:.0f} MB card")
+
+
+def stage_samples(plan, samples_dir, staging_dir, fmt, workers=None):
+    """
+    Convert every planned sample into `staging_dir` across a process pool,
+    skipping ones already converted from the same source to the same format.
+
+    Returns:
+        dict: Counts of converted, reused and failed samples.
+    """
+    os.makedirs(staging_dir, exist_ok=True)
+    manifest_path = os.path.join(staging_dir, STAGING_MANIFEST)
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    summary = {"converted": 0, "reused": 0, "failed": 0, "failed_files": []}
+    tasks = []
+    stamps = {}
+    for name in plan["samples"]:
+        input_path = os.path.join(samples_dir, name)
+        output_path = os.path.join(staging_dir, name)
+        st = os.stat(input_path)
+        stamps[name] = [st.st_size, st.st_mtime_ns, list(fmt)]
+        if manifest.get(name) == stamps[name] and os.path.exists(output_path):
+            summary["reused"] += 1
+            continue
+        tasks.append((name, input_path, output_path, fmt))
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for name, size, error in metrics.map_collected(pool, _convert_one, tasks, chunksize=8):
+                if error is not None:
+                    print(f"Error converting {name}: {error}")
+                    summary["failed"] += 1
+                    summary["failed_files"].append(name)
+                    continue
+                manifest[name] = stamps[name]
+                summary["converted"] += 1
+    finally:
+        with atomic_output(manifest_path) as tmp_path:
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f)
+    return summary
+
+
+def _same_file(src, dst):
+    try:
+        a, b = os.stat(src), os.stat(dst)
+    except FileNotFoundError:
+        return False
+    return a.st_size == b.st_size and abs(a.st_mtime - b.st_mtime) <= 2  # FAT keeps mtimes to 2 s
+
+
+@metrics.timed("card_write_seconds")
+def write_card(files, card_dir):
+    """
+    Copy (source, name) pairs onto the card one after another with large
+    buffers, skipping files it already holds.
+
+    Returns:
+        dict: Counts of written and skipped files and bytes written.
+    """
+    os.makedirs(card_dir, exist_ok=True)
+    summary = {"written": 0, "skipped": 0, "bytes": 0}
+    for src, name in files:
+        dst = os.path.join(card_dir, name)
+        if _same_file(src, dst):
+            summary["skipped"] += 1
+            continue
+        with atomic_output(dst) as tmp_path:
+            with open(src, "rb") as fsrc, open(tmp_path, "wb") as fdst:
+                shutil.copyfileobj(fsrc, fdst, COPY_BUFFER)
+            shutil.copystat(src, tmp_path)
+        summary["written"] += 1
+        summary["bytes"] += os.path.getsize(dst)
+    return summary
+
+
+def pack_card(presets_dir=PRESETS_DIR, samples_dir=SAMPLES_DIR, card_dir=CARD_DIR, fmt=None,
+              capacity=CARD_CAPACITY, cluster_size=CLUSTER_SIZE, staging_dir=None, workers=None, dry_run=False):
+    """
+    Plan, convert and copy all presets in `presets_dir` and the samples they
+    reference onto the card.
+
+    Nothing is converted or copied if the planned footprint exceeds `capacity`
+    or `dry_run` is set. Samples go on the card before the presets that use them.
+
+    Returns:
+        dict: The plan plus staging and card write summaries.
+    """
+    fmt = fmt or PackFormat(TARGET_SAMPLE_RATE, TARGET_BITS, TARGET_CHANNELS)
+    staging_dir = staging_dir or os.path.join(samples_dir, STAGING_DIR)
+    start = time.perf_counter()
+    plan = plan_card(presets_dir, samples_dir, fmt, cluster_size)
+    print_plan(plan, capacity)
+    result = {"plan": plan, "fits": plan["total"] <= capacity, "staged": None, "card": None}
+    if not result["fits"]:
+        print(f"Error: presets need {plan['total']} bytes but the card holds {capacity}. Nothing copied.")
+        return result
+    if dry_run:
+        return result
+
+    result["staged"] = stage_samples(plan, samples_dir, staging_dir, fmt, workers)
+    failed = set(result["staged"]["failed_files"])
+    files = [(os.path.join(staging_dir, name), name) for name in plan["samples"] if name not in failed]
+    files += [(os.path.join(presets_dir, preset_file), preset_file) for preset_file in plan["presets"]]
+    result["card"] = write_card(files, card_dir)
+    result["elapsed"] = time.perf_counter() - start
+    print(f"Wrote {result['card']['written']} files ({result['card']['bytes'] / 1000 ** 2:.1f} MB), "
+          f"{result['card']['skipped']} already on card, in {result['elapsed']:.1f}s")
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert and copy presets and their samples onto an Assimil8or card.")
+    parser.add_argument("--presets-dir", default=PRESETS_DIR)
+    parser.add_argument("--samples-dir", default=SAMPLES_DIR)
+    parser.add_argument("--card-dir", default=CARD_DIR)
+    parser.add_argument("--staging-dir", help=f"converted samples (default: <samples-dir>/{STAGING_DIR})")
+    parser.add_argument("--sample-rate", type=int, default=TARGET_SAMPLE_RATE)
+    parser.add_argument("--bits", type=int, choices=(8, 16, 24, 32), default=TARGET_BITS)
+    parser.add_argument("--channels", type=int, choices=(1, 2), default=TARGET_CHANNELS)
+    parser.add_argument("--capacity", type=int, default=CARD_CAPACITY, help="card size in bytes")
+    parser.add_argument("--cluster-size", type=int, default=CLUSTER_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="only report the footprint")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with metrics.session("cardpack"):
+        pack_card(args.presets_dir, args.samples_dir, args.card_dir,
+                  PackFormat(args.sample_rate, args.bits, args.channels), args.capacity, args.cluster_size,
+                  args.staging_dir, args.workers, args.dry_run)
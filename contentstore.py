@@ -0,0 +1,126 @@
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import metrics
+from audioio import atomic_output, file_digest
+
+
+def _compute(func, path):
+    try:
+        return path, func(path), None
+    except Exception as e:
+        return path, None, e
+
+
+class ContentStore:
+    """
+    Per-file results cached by content hash, persisted in one .npz next to
+    the samples.
+
+    A result is stored once per distinct file content (a renamed or copied
+    sample reuses it), and a name -> (size, mtime_ns, hash) memo means
+    unchanged files are neither re-hashed nor recomputed. Subclasses set
+    FILENAME and `compute` (a module-level function of a WAV path, run in a
+    process pool) and pack their results into .npz columns with `_columns`
+    and `_read`.
+
+    Args:
+        samples_dir (str): Directory the sample names are relative to.
+        path (str): Store file (defaults to FILENAME inside samples_dir).
+    """
+
+    FILENAME = None
+    ACTION = "processing"  # for error messages
+
+    def __init__(self, samples_dir, path=None):
+        self.samples_dir = samples_dir
+        self.path = path or os.path.join(samples_dir, self.FILENAME)
+        self.results = {}  # content hash -> result
+        self.files = {}  # sample name -> (size, mtime_ns, content hash)
+        self._load()
+
+    @staticmethod
+    def compute(path):
+        raise NotImplementedError
+
+    def _columns(self, hashes):
+        """{column: array} holding the results of `hashes`, in that order."""
+        raise NotImplementedError
+
+    def _read(self, data):
+        """{content hash: result} from a loaded .npz, or None if it was written with incompatible settings."""
+        raise NotImplementedError
+
+    def _load(self):
+        try:
+            data = np.load(self.path, allow_pickle=False)
+        except (FileNotFoundError, OSError, ValueError):
+            return
+        with data:
+            results = self._read(data)
+            if results is None:
+                return  # recompute everything
+            self.results.update(results)
+            for name, size, mtime_ns, digest in zip(data["name"], data["size"], data["mtime_ns"], data["file_hash"]):
+                self.files[str(name)] = (int(size), int(mtime_ns), str(digest))
+
+    def save(self):
+        hashes = sorted(self.results)
+        names = sorted(self.files)
+        with atomic_output(self.path) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    hash=np.array(hashes, dtype="U64"),
+                    name=np.array(names, dtype=str),
+                    size=np.array([self.files[n][0] for n in names], dtype=np.int64),
+                    mtime_ns=np.array([self.files[n][1] for n in names], dtype=np.int64),
+                    file_hash=np.array([self.files[n][2] for n in names], dtype="U64"),
+                    **self._columns(hashes)
+                )
+
+    def update(self, names=None, workers=None):
+        """
+        Bring the store up to date for `names` (default: every .wav in the
+        directory), computing results for new content across a process pool.
+
+        Returns:
+            dict: Counts of hashed files and newly computed contents.
+        """
+        if names is None:
+            names = [f for f in os.listdir(self.samples_dir) if f.endswith(".wav")]
+            # Forget files that are gone (their results stay, keyed by content)
+            for name in set(self.files) - set(names):
+                del self.files[name]
+        hashed = 0
+        todo = {}
+        for name in names:
+            path = os.path.join(self.samples_dir, name)
+            st = os.stat(path)
+            known = self.files.get(name)
+            if known is None or known[:2] != (st.st_size, st.st_mtime_ns):
+                known = (st.st_size, st.st_mtime_ns, file_digest(path))
+                self.files[name] = known
+                hashed += 1
+            if known[2] not in self.results:
+                todo.setdefault(known[2], path)
+
+        if todo:
+            by_path = {path: digest for digest, path in todo.items()}
+            task = functools.partial(_compute, self.compute)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for path, result, error in metrics.map_collected(pool, task, list(by_path), chunksize=8):
+                    if error is not None:
+                        print(f"Error {self.ACTION} {os.path.basename(path)}: {error}")
+                        continue
+                    self.results[by_path[path]] = result
+        self.save()
+        return {"hashed": hashed, "computed": len(todo)}
+
+    def lookup(self, name):
+        """Result for a sample by name, or None if it has none yet."""
+        known = self.files.get(name)
+        return self.results.get(known[2]) if known else None
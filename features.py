@@ -0,0 +1,90 @@
+import numpy as np
+
+import metrics
+from contentstore import ContentStore
+from pcm import open_pcm, to_float
+
+FEATURES_FILE = ".features.npz"  # default feature file inside the samples directory
+FEATURES = ("rms", "peak", "centroid", "zcr", "duration")
+BLOCK_FRAMES = 1 << 18  # frames analysed per vectorized step (bounds memory on long files)
+FFT_SIZE = 2048  # frame size for the spectral centroid
+
+
+@metrics.timed("feature_extract_seconds")
+def extract_features(path):
+    """
+    Compute loudness and timbre descriptors of one WAV file.
+
+    Returns:
+        dict: rms and peak (linear, full scale = 1.0), centroid (spectral
+            centroid in Hz, energy weighted over frames), zcr (zero crossings
+            per second) and duration (seconds).
+    """
+    info, samples = open_pcm(path)
+    window = np.hanning(FFT_SIZE)
+    freqs = np.fft.rfftfreq(FFT_SIZE, 1.0 / info.sample_rate)
+    sum_sq = 0.0
+    peak = 0.0
+    crossings = 0
+    weighted_freq = 0.0
+    total_mag = 0.0
+    previous_sign = None
+    for start in range(0, info.frames, BLOCK_FRAMES):
+        mono = to_float(samples[start:start + BLOCK_FRAMES], info).mean(axis=1)
+        sum_sq += float(np.dot(mono, mono))
+        peak = max(peak, float(np.abs(mono).max()))
+        signs = np.signbit(mono)
+        crossings += int(np.count_nonzero(signs[1:] != signs[:-1]))
+        if previous_sign is not None and signs[0] != previous_sign:
+            crossings += 1
+        previous_sign = signs[-1]
+        usable = len(mono) - len(mono) % FFT_SIZE
+        if usable:
+            spectrum = np.abs(np.fft.rfft(mono[:usable].reshape(-1, FFT_SIZE) * window, axis=1))
+            weighted_freq += float((spectrum * freqs).sum())
+            total_mag += float(spectrum.sum())
+    duration = info.frames / info.sample_rate if info.sample_rate else 0.0
+    return {
+        "rms": float(np.sqrt(sum_sq / info.frames)) if info.frames else 0.0,
+        "peak": peak,
+        "centroid": weighted_freq / total_mag if total_mag else 0.0,
+        "zcr": crossings / duration if duration else 0.0,
+        "duration": duration,
+    }
+
+
+class FeatureStore(ContentStore):
+    """
+    Cached, columnar feature table keyed by content hash (see
+    contentstore.ContentStore); every feature is one float64 column.
+
+    Args:
+        samples_dir (str): Directory the sample names are relative to.
+        path (str): Feature file (defaults to FEATURES_FILE inside samples_dir).
+    """
+
+    FILENAME = FEATURES_FILE
+    ACTION = "analysing"
+    compute = staticmethod(extract_features)
+
+    def _columns(self, hashes):
+        return {name: np.array([self.results[h][name] for h in hashes], dtype=np.float64) for name in FEATURES}
+
+    def _read(self, data):
+        return {str(digest): {name: float(data[name][i]) for name in FEATURES} for i, digest in enumerate(data["hash"])}
+
+    def value(self, name, feature, default=None):
+        features = self.lookup(name)
+        return features[feature] if features else default
+
+
+def order_by_feature(samples, store, feature, descending=True):
+    """
+    Sort a bank of samples by a stored feature (unanalysed samples go last),
+    e.g. brightest first so CV sweeps from bright at +4.52 V down to dark at -5.00 V.
+    """
+    if feature not in FEATURES:
+        raise ValueError(f"Unknown feature {feature!r}; expected one of {FEATURES}")
+    known = [s for s in samples if store.lookup(s) is not None]
+    unknown = [s for s in samples if store.lookup(s) is None]
+    return sorted(known, key=lambda s: store.value(s, feature), reverse=descending) + unknown
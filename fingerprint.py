@@ -0,0 +1,248 @@
+import numpy as np
+
+import metrics
+from contentstore import ContentStore
+from pcm import open_pcm, to_float
+
+SAMPLES_DIR = "/Users/mikesidnam/Desktop/Keepers/NormalizedKeepers"
+FINGERPRINTS_FILE = ".fingerprints.npz"  # default fingerprint file inside the samples directory
+
+# Signature: log band energies over a few time segments, hashed by random projections
+SIGNATURE_BITS = 128
+BANDS = 32  # mel-spaced between BAND_LOW and BAND_HIGH (Hz), so the hash does not depend on the sample rate
+BAND_LOW = 100.0
+BAND_HIGH = 11000.0
+SEGMENTS = 4  # equal fractions of the sound, from its first to its last non-silent frame
+EDGE_LEVEL = -30.0  # dB below the loudest frame; quieter frames at either end are skipped
+FLOOR_LEVEL = -40.0  # dB below the loudest band; quieter band energies are clamped to it
+FFT_SIZE = 4096
+BLOCK_FRAMES = 1 << 18
+PROJECTION_SEED = 0x5EED  # changing it invalidates every stored signature
+SIGNATURE_VERSION = 2  # bumped whenever fingerprint() changes; stored signatures of other versions are recomputed
+
+# LSH index: each table keys samples on LSH_BITS randomly sampled signature bits
+LSH_TABLES = 20
+LSH_BITS = 16
+MAX_DISTANCE = 12  # Hamming distance (of SIGNATURE_BITS) at or below which two samples are near-duplicates
+
+_PROJECTIONS = np.random.default_rng(PROJECTION_SEED).standard_normal((SIGNATURE_BITS, SEGMENTS * BANDS))
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)  # set bits per byte value
+
+
+def _mel(freq):
+    return 2595.0 * np.log10(1.0 + freq / 700.0)
+
+
+def _band_matrix(sample_rate):
+    freqs = np.fft.rfftfreq(FFT_SIZE, 1.0 / sample_rate)
+    edges = 700.0 * (10 ** (np.linspace(_mel(BAND_LOW), _mel(BAND_HIGH), BANDS + 1) / 2595.0) - 1.0)
+    band = np.searchsorted(edges, freqs, side="right") - 1
+    matrix = np.zeros((len(freqs), BANDS))
+    inside = (band >= 0) & (band < BANDS)
+    matrix[np.flatnonzero(inside), band[inside]] = 1.0
+    return matrix
+
+
+@metrics.timed("fingerprint_seconds")
+def fingerprint(path):
+    """
+    Compact spectral-hash signature of one WAV file.
+
+    The file's mono spectrum is summed into mel-spaced bands, averaged over
+    SEGMENTS equal parts of the sound (silent edges skipped, so trimmed copies
+    match) and taken in dB relative to its own mean (so level changes do not
+    matter). The signs of SIGNATURE_BITS fixed random projections of that
+    vector are the signature bits, so the Hamming distance between two
+    signatures tracks the angle between their spectra.
+
+    Returns:
+        ndarray: SIGNATURE_BITS // 8 bytes (uint8).
+    """
+    info, samples = open_pcm(path)
+    matrix = _band_matrix(info.sample_rate)
+    window = np.hanning(FFT_SIZE)
+    energies = []
+    for start in range(0, max(info.frames, 1), BLOCK_FRAMES):
+        mono = to_float(samples[start:start + BLOCK_FRAMES], info).mean(axis=1)
+        usable = max(FFT_SIZE, len(mono) - len(mono) % FFT_SIZE)
+        mono = np.pad(mono, (0, max(0, usable - len(mono))))[:usable]
+        spectrum = np.abs(np.fft.rfft(mono.reshape(-1, FFT_SIZE) * window, axis=1)) ** 2
+        energies.append(spectrum @ matrix)
+    energies = np.concatenate(energies)
+    totals = energies.sum(axis=1)
+    loud = np.flatnonzero(totals >= totals.max() * 10 ** (EDGE_LEVEL / 10.0))
+    if loud.size:
+        energies = energies[loud[0]:loud[-1] + 1]
+    if len(energies) < SEGMENTS:  # very short sounds: repeat frames so no segment is empty
+        energies = np.repeat(energies, -(-SEGMENTS // len(energies)), axis=0)
+    profile = np.array([part.mean(axis=0) for part in np.array_split(energies, SEGMENTS)])
+    db = 10 * np.log10(profile + profile.max() * 10 ** (FLOOR_LEVEL / 10.0) + 1e-20).ravel()
+    return np.packbits(_PROJECTIONS @ (db - db.mean()) > 0)
+
+
+def _popcount(words):
+    """Set bits per row of a 2-D uint64 array (np.bitwise_count only exists from NumPy 2.0)."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT[np.ascontiguousarray(words).view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+
+class FingerprintIndex:
+    """
+    Bit-sampling LSH index over signatures for near-duplicate queries.
+
+    Each of `tables` tables keys every sample on the same `bits` randomly
+    chosen signature bits; samples within `max_distance` of a query almost
+    always agree with it on every sampled bit of at least one table. The
+    candidates from all tables are then checked by exact Hamming distance.
+    Tables are sorted key arrays, so a query is one binary search per table.
+
+    Args:
+        signatures: {name: signature} as returned by fingerprint().
+        tables (int): Number of hash tables.
+        bits (int): Signature bits sampled per table (at most 63).
+        max_distance (int): Largest Hamming distance reported as a near-duplicate.
+        seed (int): Seed for choosing the sampled bits.
+    """
+
+    def __init__(self, signatures, tables=LSH_TABLES, bits=LSH_BITS, max_distance=MAX_DISTANCE, seed=0):
+        self.names = list(signatures)
+        self.max_distance = max_distance
+        self._position = {name: i for i, name in enumerate(self.names)}
+        packed = np.array([signatures[name] for name in self.names], dtype=np.uint8).reshape(-1, SIGNATURE_BITS // 8)
+        self._words = packed.view(np.uint64)  # for popcount distances
+        rng = np.random.default_rng(seed)
+        self._sampled = np.array([rng.choice(SIGNATURE_BITS, bits, replace=False) for _ in range(tables)])
+        self._weights = np.left_shift(np.uint64(1), np.arange(bits, dtype=np.uint64))
+        keys = self._keys(np.unpackbits(packed, axis=1))  # (samples, tables)
+        self._order = np.argsort(keys, axis=0, kind="stable")
+        self._sorted = np.take_along_axis(keys, self._order, axis=0)
+        self._near = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _keys(self, bits):
+        return (bits[:, self._sampled].astype(np.uint64) * self._weights).sum(axis=2, dtype=np.uint64)
+
+    def query(self, signature, max_distance=None, exclude=None):
+        """
+        Samples whose signature lies within `max_distance` of `signature`.
+
+        Returns:
+            list: (name, distance) pairs, closest first.
+        """
+        if not self.names:
+            return []
+        max_distance = self.max_distance if max_distance is None else max_distance
+        signature = np.asarray(signature, dtype=np.uint8).reshape(1, -1)
+        keys = self._keys(np.unpackbits(signature, axis=1))[0]
+        found = []
+        for table, key in enumerate(keys):
+            lo = np.searchsorted(self._sorted[:, table], key, side="left")
+            hi = np.searchsorted(self._sorted[:, table], key, side="right")
+            if hi > lo:
+                found.append(self._order[lo:hi, table])
+        if not found:
+            return []
+        candidates = np.unique(np.concatenate(found))
+        distances = _popcount(self._words[candidates] ^ signature.view(np.uint64))
+        close = distances <= max_distance
+        return sorted(((self.names[i], int(d)) for i, d in zip(candidates[close], distances[close])
+                       if self.names[i] != exclude), key=lambda pair: pair[1])
+
+    def near_duplicates(self, name):
+        """Names of the indexed samples that are near-duplicates of `name` (cached per name)."""
+        near = self._near.get(name)
+        if near is None:
+            i = self._position.get(name)
+            if i is None:
+                return frozenset()
+            signature = self._words[i].view(np.uint8)
+            near = self._near[name] = frozenset(n for n, _ in self.query(signature, exclude=name))
+        return near
+
+    def conflicts(self, sample, bank):
+        """BankAssigner `conflicts` hook: reject a sample that nearly duplicates one already in the bank."""
+        if not bank:
+            return False
+        near = self.near_duplicates(sample)
+        return bool(near) and any(other in near for other in bank)
+
+    def duplicate_groups(self):
+        """Clusters (lists of names, two or more) of samples linked by near-duplicate pairs."""
+        parent = list(range(len(self.names)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for name in self.names:
+            for other in self.near_duplicates(name):
+                parent[find(self._position[name])] = find(self._position[other])
+        groups = {}
+        for i, name in enumerate(self.names):
+            groups.setdefault(find(i), []).append(name)
+        return sorted((sorted(g) for g in groups.values() if len(g) > 1), key=len, reverse=True)
+
+
+class FingerprintStore(ContentStore):
+    """
+    Cached signatures keyed by content hash (see contentstore.ContentStore).
+    The file records PROJECTION_SEED and SIGNATURE_VERSION; signatures stored
+    under other settings are not comparable and are recomputed.
+
+    Args:
+        samples_dir (str): Directory the sample names are relative to.
+        path (str): Fingerprint file (defaults to FINGERPRINTS_FILE inside samples_dir).
+    """
+
+    FILENAME = FINGERPRINTS_FILE
+    ACTION = "fingerprinting"
+    compute = staticmethod(fingerprint)
+
+    def _columns(self, hashes):
+        return {
+            "seed": np.array(PROJECTION_SEED),
+            "version": np.array(SIGNATURE_VERSION),
+            "signature": np.array([self.results[h] for h in hashes], dtype=np.uint8).reshape(-1, SIGNATURE_BITS // 8),
+        }
+
+    def _read(self, data):
+        version = int(data["version"]) if "version" in data.files else 1
+        if (int(data["seed"]) != PROJECTION_SEED or version != SIGNATURE_VERSION
+                or data["signature"].shape[1:] != (SIGNATURE_BITS // 8,)):
+            return None
+        return {str(digest): signature for digest, signature in zip(data["hash"], data["signature"])}
+
+    def conflicts(self, sample, bank, max_distance=MAX_DISTANCE):
+        """
+        BankAssigner `conflicts` hook comparing signatures directly, without an
+        index: a bank holds only a few samples, and the store can keep changing
+        between draws (see watch.py).
+        """
+        signature = self.lookup(sample) if bank else None
+        if signature is None:
+            return False
+        others = [s for s in (self.lookup(name) for name in bank if name != sample) if s is not None]
+        if not others:
+            return False
+        words = np.array(others, dtype=np.uint8).view(np.uint64)
+        signature = np.ascontiguousarray(signature, dtype=np.uint8).view(np.uint64)
+        return bool((_popcount(words ^ signature) <= max_distance).any())
+
+    def index(self, names=None, **kwargs):
+        """FingerprintIndex over `names` (default: every known sample); kwargs go to FingerprintIndex."""
+        names = self.files if names is None else names
+        signatures = {name: self.lookup(name) for name in names}
+        return FingerprintIndex({n: s for n, s in signatures.items() if s is not None}, **kwargs)
+
+
+if __name__ == "__main__":
+    with metrics.session("fingerprint"):
+        store = FingerprintStore(SAMPLES_DIR)
+        print(store.update())
+        for group in store.index().duplicate_groups():
+            print("Near-duplicates:", ", ".join(group))
@@ -0,0 +1,177 @@
+import json
+import os
+import re
+import threading
+import time
+
+from audioio import WavFormatError, atomic_output, read_wav_info
+
+# Job states, in order
+QUEUED = "queued"
+IN_FLIGHT = "in_flight"
+COMPLETED = "completed"  # output written
+VERIFIED = "verified"  # output re-read and found whole
+STATES = (QUEUED, IN_FLIGHT, COMPLETED, VERIFIED)
+
+COMPACT_RATIO = 4  # rewrite the journal once it holds this many records per job
+MIN_DURATION_RATIO = 0.5  # a WAV shorter than this fraction of the requested duration counts as truncated
+
+# Temporaries of audioio.atomic_output() (".<name>.<pid>.<thread>.part") and SoundCache.writer() (no dot)
+_PART_FILE = re.compile(r"^\.?(?P<name>.+)\.(?P<pid>\d+)\.\d+\.part$")
+
+
+class Journal:
+    """
+    Append-only, fsync'd JSON-lines log of job state changes.
+
+    Every change is one line {"job", "state", "time", ...extra fields}; replaying
+    the file gives each job's latest state and fields, so a run that is killed at
+    any point (a torn last line is ignored) can pick up exactly where it stopped.
+    The log is compacted to one line per job, atomically, when it is opened and
+    has grown past COMPACT_RATIO lines per job.
+
+    Args:
+        path (str): Journal file (created on first use).
+        sync (bool): fsync after every record (off trades durability for speed).
+    """
+
+    def __init__(self, path, sync=True):
+        self.path = path
+        self.sync = sync
+        self.jobs = {}  # job id -> {"state": ..., fields...}
+        self._lock = threading.Lock()
+        records = self._replay()
+        if records > COMPACT_RATIO * max(len(self.jobs), 1):
+            self.compact()
+        self._file = open(path, "a")
+
+    def _replay(self):
+        records = 0
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return records
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # A torn write from a crash: cut it off so the next record starts on a line of its own
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            job = record.pop("job")
+            record.pop("time", None)
+            self.jobs.setdefault(job, {}).update(record)
+            records += 1
+        return records
+
+    def compact(self):
+        """Rewrite the journal as one record per job (atomically)."""
+        with atomic_output(self.path) as tmp_path:
+            with open(tmp_path, "w") as f:
+                for job, fields in self.jobs.items():
+                    f.write(json.dumps(dict(fields, job=job)) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record(self, job, state, **fields):
+        """Durably record that `job` entered `state` (with optional extra fields)."""
+        self.record_many([(job, state, fields)])
+
+    def record_many(self, records):
+        """Record several (job, state, fields) changes with a single fsync."""
+        lines = []
+        with self._lock:
+            for job, state, fields in records:
+                if state not in STATES:
+                    raise ValueError(f"state must be one of {STATES}, got {state!r}")
+                self.jobs.setdefault(job, {}).update(fields, state=state)
+                lines.append(json.dumps(dict(fields, job=job, state=state, time=time.time())) + "\n")
+            if not lines:
+                return
+            self._file.writelines(lines)
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+
+    def state(self, job):
+        return self.jobs.get(job, {}).get("state")
+
+    def get(self, job, field, default=None):
+        return self.jobs.get(job, {}).get(field, default)
+
+    def in_state(self, *states):
+        """Jobs whose latest state is one of `states`."""
+        return [job for job, fields in self.jobs.items() if fields.get("state") in states]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def verify_wav(path, expected_seconds=None):
+    """
+    Check that `path` is a whole, readable WAV (and, given `expected_seconds`,
+    not much shorter than requested).
+
+    Raises:
+        WavFormatError: If the file is missing, unreadable, empty or truncated.
+    """
+    try:
+        info = read_wav_info(path)
+    except FileNotFoundError:
+        raise WavFormatError(f"{path}: missing")
+    if info.frames == 0:
+        raise WavFormatError(f"{path}: no audio")
+    if expected_seconds and info.frames / info.sample_rate < expected_seconds * MIN_DURATION_RATIO:
+        raise WavFormatError(f"{path}: {info.frames / info.sample_rate:.2f}s of {expected_seconds}s requested")
+    return info
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def clean_orphans(directory, stems=()):
+    """
+    Remove what a killed run leaves behind in `directory`: atomic_output()
+    temporaries of processes that are gone, and .mp3 files named after one of
+    `stems` (intermediate downloads of those jobs).
+
+    Returns:
+        list: Names of the removed files.
+    """
+    stems = set(stems)
+    removed = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return removed
+    for name in names:
+        match = _PART_FILE.match(name)
+        if match is not None:
+            pid = int(match.group("pid"))
+            orphaned = pid != os.getpid() and not _pid_alive(pid)
+        else:
+            orphaned = name.lower().endswith(".mp3") and os.path.splitext(name)[0] in stems
+        if orphaned:
+            try:
+                os.remove(os.path.join(directory, name))
+                removed.append(name)
+            except FileNotFoundError:
+                pass
+    return removed
@@ -0,0 +1,230 @@
+import bisect
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_FILE_ENV = "METRICS_FILE"  # write this run's metrics here (.prom/.txt = Prometheus text, else JSON)
+PROFILE_FILE_ENV = "PROFILE_FILE"  # dump cProfile stats here (read with `python -m pstats`)
+PROMETHEUS_PREFIX = "samplegen_"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    """Count, sum, min, max and per-bucket (non-cumulative) counts of observed values."""
+
+    __slots__ = ("bounds", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max,
+                "bounds": list(self.bounds), "counts": list(self.counts)}
+
+    def merge(self, data):
+        if tuple(data["bounds"]) != self.bounds:
+            raise ValueError("Cannot merge histograms with different buckets")
+        self.counts = [a + b for a, b in zip(self.counts, data["counts"])]
+        self.count += data["count"]
+        self.sum += data["sum"]
+        for attr, pick in (("min", min), ("max", max)):
+            if data[attr] is not None:
+                current = getattr(self, attr)
+                setattr(self, attr, data[attr] if current is None else pick(current, data[attr]))
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and histograms (timers are histograms of seconds).
+
+    Worker processes keep their own registry; wrap pool tasks with collected()
+    and pass results through unwrap() (or use map_collected()) to fold their
+    metrics into the parent's.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, bounds=LATENCY_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(bounds)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the block into histogram `name` (also on errors, which count in `<name>_errors`)."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(f"{name}_errors")
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator form of timer()."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        with self._lock:
+            return {"counters": dict(self.counters),
+                    "histograms": {name: h.to_dict() for name, h in self.histograms.items()}}
+
+    def drain(self):
+        """Snapshot and reset (what a pool worker hands back to its parent)."""
+        with self._lock:
+            data = {"counters": self.counters,
+                    "histograms": {name: h.to_dict() for name, h in self.histograms.items()}}
+            self.counters = {}
+            self.histograms = {}
+        return data
+
+    def merge(self, data):
+        with self._lock:
+            for name, value in data["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, hist in data["histograms"].items():
+                if name not in self.histograms:
+                    self.histograms[name] = Histogram(hist["bounds"])
+                self.histograms[name].merge(hist)
+
+    def to_json(self, **extra):
+        return json.dumps(dict(extra, **self.snapshot()), indent=2, sort_keys=True)
+
+    def to_prometheus(self, **gauges):
+        """Prometheus text exposition format; `gauges` are extra name=value samples."""
+        data = self.snapshot()
+        lines = []
+        for name, value in sorted(gauges.items()):
+            lines += [f"# TYPE {PROMETHEUS_PREFIX}{name} gauge", f"{PROMETHEUS_PREFIX}{name} {value}"]
+        for name, value in sorted(data["counters"].items()):
+            metric = f"{PROMETHEUS_PREFIX}{name}" + ("" if name.endswith("_total") else "_total")
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, hist in sorted(data["histograms"].items()):
+            metric = PROMETHEUS_PREFIX + name
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(hist["bounds"] + ["+Inf"], hist["counts"]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f"{metric}_sum {hist['sum']}", f"{metric}_count {hist['count']}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, **extra):
+        """Write the metrics to `path`: Prometheus text for .prom/.txt, JSON otherwise."""
+        if path.endswith((".prom", ".txt")):
+            text = self.to_prometheus(**{k: v for k, v in extra.items() if isinstance(v, (int, float))})
+        else:
+            text = self.to_json(**extra)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.part"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+REGISTRY = Metrics()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+timed = REGISTRY.timed
+
+
+def _reset_after_fork():
+    # A forked worker starts with a copy of the parent's metrics (and maybe a held lock)
+    REGISTRY._lock = threading.Lock()
+    REGISTRY.counters = {}
+    REGISTRY.histograms = {}
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _call_collected(func, *args, **kwargs):
+    result = func(*args, **kwargs)
+    return result, REGISTRY.drain()
+
+
+def collected(func):
+    """
+    Picklable wrapper for process pool tasks: calling it returns (result,
+    metrics recorded in the worker meanwhile); unwrap() merges them back.
+    """
+    return functools.partial(_call_collected, func)
+
+
+def unwrap(pair):
+    result, data = pair
+    REGISTRY.merge(data)
+    return result
+
+
+def map_collected(pool, func, iterable, chunksize=1):
+    """pool.map(func, iterable) that also folds each worker's metrics into this process."""
+    for pair in pool.map(collected(func), iterable, chunksize=chunksize):
+        yield unwrap(pair)
+
+
+@contextmanager
+def session(script=None):
+    """
+    Wrap a script's entry point. With $PROFILE_FILE set the run is profiled
+    with cProfile; with $METRICS_FILE set the metrics are written there when it
+    ends (even on failure). Both paths may use {script}, {pid} and {time}
+    placeholders so every run gets its own file.
+    """
+    script = script or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+    fields = {"script": script, "pid": os.getpid(), "time": time.strftime("%Y%m%d-%H%M%S")}
+    profile_path = os.environ.get(PROFILE_FILE_ENV)
+    metrics_path = os.environ.get(METRICS_FILE_ENV)
+    profiler = cProfile.Profile() if profile_path else None
+    started = time.time()
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield REGISTRY
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path.format(**fields))
+        if metrics_path:
+            REGISTRY.write(metrics_path.format(**fields), script=script, run_started_seconds=started,
+                           run_elapsed_seconds=elapsed)
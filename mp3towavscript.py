@@ -1,43 +1,183 @@
+import json
 import os
+import shutil
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def convert_mp3_to_wav(input_folder, output_folder):
+import metrics
+from audioio import FFMPEG, WavFormatError, atomic_output, file_digest
+from journal import VERIFIED, Journal, clean_orphans, verify_wav
+
+MANIFEST_FILE = ".mp3towav.json"  # per output folder: what each WAV was converted from
+JOURNAL_FILE = ".mp3towav.journal"  # per output folder: conversions finished since the manifest was last saved
+CHECK_MODES = ("mtime", "size", "hash", "none")
+
+
+def load_manifest(output_folder):
+    try:
+        with open(os.path.join(output_folder, MANIFEST_FILE), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(output_folder, manifest):
+    path = os.path.join(output_folder, MANIFEST_FILE)
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def is_up_to_date(input_path, output_path, check, entry):
+    """
+    Decide whether `output_path` can be kept.
+
+    Args:
+        check (str): "mtime" - output is newer than the input;
+            "size" - input size and mtime, and output size, match the manifest;
+            "hash" - input content hash matches the manifest;
+            "none" - always reconvert.
+        entry (dict): Manifest entry recorded when the output was written (or None).
+    """
+    if check == "none":
+        return False
+    try:
+        out_stat = os.stat(output_path)
+    except FileNotFoundError:
+        return False
+    if out_stat.st_size == 0:
+        return False
+    in_stat = os.stat(input_path)
+    if check == "mtime":
+        return out_stat.st_mtime_ns >= in_stat.st_mtime_ns
+    if entry is None or entry.get("output_size") != out_stat.st_size:
+        return False
+    if check == "size":
+        return entry.get("size") == in_stat.st_size and entry.get("mtime_ns") == in_stat.st_mtime_ns
+    return entry.get("sha256") == file_digest(input_path)
+
+
+@metrics.timed("mp3_convert_seconds")
+def convert_file(input_path, output_path, ffmpeg=FFMPEG):
+    """Convert one MP3 to WAV with ffmpeg, publishing the output atomically."""
+    with atomic_output(output_path) as tmp_path:
+        # Use ffmpeg to convert MP3 to WAV
+        subprocess.run(
+            [ffmpeg, '-i', input_path, '-f', 'wav', '-y', tmp_path],
+            check=True,
+            capture_output=True,
+            text=True
+        )
+
+
+def _convert_one(filename, input_folder, output_folder, check, entry):
+    input_path = os.path.join(input_folder, filename)
+    output_filename = os.path.splitext(filename)[0] + ".wav"
+    output_path = os.path.join(output_folder, output_filename)
+
+    if is_up_to_date(input_path, output_path, check, entry):
+        return "skipped", filename, entry, 0
+
+    try:
+        convert_file(input_path, output_path)
+        verify_wav(output_path)
+    except subprocess.CalledProcessError as e:
+        print(f"Error converting {filename}: {e.stderr}")
+        return "failed", filename, None, 0
+    except WavFormatError as e:
+        print(f"Error converting {filename}: {e}")
+        return "failed", filename, None, 0
+    except Exception as e:
+        print(f"An unexpected error occurred converting {filename}: {e}")
+        return "failed", filename, None, 0
+
+    in_stat = os.stat(input_path)
+    entry = {
+        "size": in_stat.st_size,
+        "mtime_ns": in_stat.st_mtime_ns,
+        "output_size": os.path.getsize(output_path),
+    }
+    if check == "hash":
+        entry["sha256"] = file_digest(input_path)
+    print(f"Converted: {filename} -> {output_filename}")
+    return "converted", filename, entry, in_stat.st_size
+
+
+def convert_mp3_to_wav(input_folder, output_folder, workers=None, check="mtime", filenames=None):
     """
     Converts all MP3 files in the input folder to WAV files in the output folder.
 
+    Files are converted by a pool of ffmpeg workers. Outputs that are already up
+    to date are skipped, and a failure only affects its own file.
+
     Args:
         input_folder (str): Path to the folder containing MP3 files.
         output_folder (str): Path to the folder where WAV files will be saved.
+        workers (int): Concurrent ffmpeg processes (defaults to the CPU count).
+        check (str): How to judge an existing WAV up to date; see is_up_to_date().
+        filenames (list): Only convert these MP3s (default: every MP3 in the input folder).
+
+    Returns:
+        dict: Summary with converted/skipped/failed counts, failed file names,
+            elapsed seconds and throughput.
     """
+    if check not in CHECK_MODES:
+        raise ValueError(f"check must be one of {CHECK_MODES}, got {check!r}")
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith(".mp3"):
-            input_path = os.path.join(input_folder, filename)
-            output_filename = os.path.splitext(filename)[0] + ".wav"
-            output_path = os.path.join(output_folder, output_filename)
-
-            try:
-                # Use ffmpeg to convert MP3 to WAV
-                subprocess.run(
-                    ['ffmpeg', '-i', input_path, output_path],
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
-                print(f"Converted: {filename} -> {output_filename}")
-            except subprocess.CalledProcessError as e:
-                print(f"Error converting {filename}: {e.stderr}")
-            except FileNotFoundError:
-                print("Error: ffmpeg not found. Make sure ffmpeg is installed and in your PATH.")
-                break
-            except Exception as e:
-                print(f"An unexpected error occurred: {e}")
-                break
+    summary = {"converted": 0, "skipped": 0, "failed": 0, "failed_files": [],
+               "elapsed": 0.0, "files_per_sec": 0.0, "mb_per_sec": 0.0}
+    if shutil.which(FFMPEG) is None:
+        print("Error: ffmpeg not found. Make sure ffmpeg is installed and in your PATH.")
+        return summary
+
+    if filenames is None:
+        filenames = sorted(f for f in os.listdir(input_folder) if f.lower().endswith(".mp3"))
+    manifest = load_manifest(output_folder)
+    # Conversions a killed run finished (and journaled) count as done; its temporaries are removed
+    journal = Journal(os.path.join(output_folder, JOURNAL_FILE))
+    for filename in journal.in_state(VERIFIED):
+        manifest[filename] = {k: v for k, v in journal.jobs[filename].items() if k != "state"}
+    clean_orphans(output_folder)
+    workers = workers or os.cpu_count() or 1
+    converted_bytes = 0
+    start = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_convert_one, filename, input_folder, output_folder, check,
+                                   manifest.get(filename)) for filename in filenames]
+            for future in futures:
+                status, filename, entry, size = future.result()
+                summary[status] += 1
+                if status == "failed":
+                    summary["failed_files"].append(filename)
+                    manifest.pop(filename, None)
+                elif entry is not None:
+                    manifest[filename] = entry
+                    if status == "converted":
+                        journal.record(filename, VERIFIED, **entry)
+                converted_bytes += size
+    finally:
+        save_manifest(output_folder, manifest)
+        journal.close()
+    os.remove(journal.path)  # everything it held is in the manifest now
+
+    elapsed = time.perf_counter() - start
+    summary["elapsed"] = elapsed
+    if elapsed > 0:
+        summary["files_per_sec"] = summary["converted"] / elapsed
+        summary["mb_per_sec"] = converted_bytes / elapsed / 1e6
+    print(f"Converted {summary['converted']}, skipped {summary['skipped']}, failed {summary['failed']} "
+          f"in {elapsed:.1f}s ({summary['files_per_sec']:.1f} files/s, {summary['mb_per_sec']:.1f} MB/s)")
+    return summary
+
 
 if __name__ == "__main__":
     input_folder = "/Users/mikesidnam/Desktop/morphagene"  # Targeted input folder
     output_folder = "/Users/mikesidnam/Desktop/morphagene"  # Targeted output folder
 
-    convert_mp3_to_wav(input_folder, output_folder)
+    with metrics.session("mp3towav"):
+        convert_mp3_to_wav(input_folder, output_folder)
@@ -1,21 +1,15 @@
+import argparse
+import json
 import os
 import random
-import yaml
-from dotenv import load_dotenv
-from elevenlabs import ElevenLabs
-from pydub import AudioSegment
-from collections import defaultdict
 
-# Load .env file
-load_dotenv()
-
-# Retrieve API Key
-API_KEY = os.getenv("API_KEY")
-if not API_KEY:
-    raise ValueError("API_KEY is missing. Set it in your .env file or environment variables.")
-
-# Initialize ElevenLabs client
-client = ElevenLabs(api_key=API_KEY)
+import metrics
+from audioio import WavFormatError, decode_mp3_stream
+from bankassign import BankAssigner
+from journal import COMPLETED, IN_FLIGHT, QUEUED, VERIFIED, Journal, clean_orphans, verify_wav
+from preset import Preset
+from samplecache import SoundCache
+from soundgen import GenerationJob, SoundGenerator
 
 # Directories
 SAMPLES_DIR = "/Users/mikesidnam/Desktop/samples/11api/1"
@@ -24,9 +18,23 @@ NUM_PRESETS = 4
 CHANNELS_PER_PRESET = 8
 SAMPLES_PER_CHANNEL = 8
 
-# Ensure directories exist
-os.makedirs(SAMPLES_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# API concurrency / rate limiting
+MAX_IN_FLIGHT = 4  # concurrent sound effect requests
+REQUESTS_PER_SECOND = 2.0  # sustained request rate
+MAX_RETRIES = 5  # retries per sample on 429/5xx
+
+# Content-addressed cache of generated audio, keyed by prompt, duration and request settings
+CACHE_DIR = os.path.join(SAMPLES_DIR, ".soundcache")
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # evict least recently used audio beyond 2 GB
+SOUND_SETTINGS = {}  # extra text_to_sound_effects.convert arguments (e.g. prompt_influence)
+PROMPT_SEED = None  # seed for assigning prompts to slots; None = chosen on the first run and kept in the journal
+JOURNAL_FILE = os.path.join(SAMPLES_DIR, ".jobs.journal")  # state and cache entry of every sound_pX_cY_Z.wav
+LEGACY_SLOT_MANIFEST = os.path.join(SAMPLES_DIR, "slots.json")  # what older runs recorded instead
+ASSIGNMENT_JOB = "prompt-assignment"  # journal entry holding the prompt seed
+
+# Zone ordering: sort each channel's samples by a cached audio feature (see features.FEATURES), None = as generated
+ZONE_ORDER_FEATURE = None  # e.g. "centroid" to sweep from bright (Zone 1, +4.52) to dark (Zone 8, -5.00)
+ZONE_ORDER_DESCENDING = True
 
 # List of prompts (expand as needed, minimum 64 for unique samples per preset)
 prompts = [
@@ -100,78 +108,178 @@ prompts = [
 durations = [10, 8, 12, 6, 10, 8, 12, 6]  # 8 durations, one per sample in a bank
 
 
+def make_client():
+    # The API client (and its credentials) are only needed when samples are generated
+    from dotenv import load_dotenv
+    from elevenlabs import ElevenLabs
+
+    load_dotenv()
+    api_key = os.getenv("API_KEY")
+    if not api_key:
+        raise ValueError("API_KEY is missing. Set it in your .env file or environment variables.")
+    return ElevenLabs(api_key=api_key)
+
+
+def sample_name(preset_idx, channel_idx, zone_idx):
+    """File name of a generated sample slot (all indices zero based)."""
+    return f"sound_p{preset_idx + 1}_c{channel_idx + 1}_{zone_idx + 1}.wav"
+
+
+# Decode one streamed API response straight into the sample's WAV file
+def render_sample(job, audio_generator):
+    print(f"Generating: {job.prompt} ({job.duration}s) -> {job.output_wav}")
+    decode_mp3_stream(audio_generator, job.output_wav)
+    return os.path.basename(job.output_wav)
+
+
+def open_journal():
+    """
+    Open the job journal, import the slots an older run recorded in slots.json
+    (as completed, so they are verified rather than paid for again) and clear
+    out temporaries a killed run left behind.
+    """
+    journal = Journal(JOURNAL_FILE)
+    if not journal.jobs:
+        try:
+            with open(LEGACY_SLOT_MANIFEST, "r") as f:
+                legacy = json.load(f)
+        except (FileNotFoundError, ValueError):
+            legacy = {}
+        journal.record_many((sample, COMPLETED, {"key": key}) for sample, key in legacy.items())
+    removed = clean_orphans(SAMPLES_DIR, [os.path.splitext(job)[0] for job in journal.jobs if job.endswith(".wav")])
+    if os.path.isdir(CACHE_DIR):
+        for entry in os.scandir(CACHE_DIR):
+            if entry.is_dir():
+                removed += clean_orphans(entry.path)
+    if removed:
+        print(f"Removed {len(removed)} files left over from an interrupted run")
+    return journal
+
+
+def is_done(journal, sample, key, output_wav, duration):
+    """
+    True if the slot already holds a whole WAV for `key`. A completed but
+    unverified output (the run died before checking it) is verified now.
+    """
+    if journal.get(sample, "key") != key:
+        return False
+    state = journal.state(sample)
+    if state == VERIFIED:
+        try:
+            return os.path.getsize(output_wav) == journal.get(sample, "size")
+        except FileNotFoundError:
+            return False
+    if state not in (IN_FLIGHT, COMPLETED):  # in flight: the atomic write may still have finished
+        return False
+    try:
+        verify_wav(output_wav, duration)
+    except WavFormatError as e:
+        print(f"Regenerating {sample}: {e}")
+        return False
+    journal.record(sample, VERIFIED, size=os.path.getsize(output_wav))
+    return True
+
+
 # Generate banks of 8 samples, ensuring uniqueness per channel
-def generate_sample_banks(num_presets):
+def generate_sample_banks(num_presets, generator=None):
+    os.makedirs(SAMPLES_DIR, exist_ok=True)
     sample_banks = []
-    used_prompts = set()
+    jobs = []
+    journal = open_journal()
+    queued = []
+    # Resumed runs must give every slot the same prompt again, or finished samples would look stale
+    seed = PROMPT_SEED if PROMPT_SEED is not None else journal.get(ASSIGNMENT_JOB, "seed")
+    if seed is None:
+        seed = random.SystemRandom().randrange(1 << 32)
+    if journal.get(ASSIGNMENT_JOB, "seed") != seed:
+        journal.record(ASSIGNMENT_JOB, COMPLETED, seed=seed)
     total_samples_needed = num_presets * CHANNELS_PER_PRESET * SAMPLES_PER_CHANNEL
 
     if len(prompts) < total_samples_needed:
         print(f"Warning: Only {len(prompts)} prompts available, need {total_samples_needed}. Duplicates will occur.")
 
-    for preset_idx in range(num_presets):
+    # Pick every bank up front, in preset/channel/zone order, then generate the missing samples concurrently.
+    # Prompts are not reused across presets until every prompt has been used once.
+    assigner = BankAssigner(prompts, bank_size=SAMPLES_PER_CHANNEL, banks_per_preset=CHANNELS_PER_PRESET,
+                            unique_across=None, rng=random.Random(seed))
+    for preset_idx, preset_prompts in enumerate(assigner.assign(num_presets)):
         preset_banks = []
-        for channel_idx in range(CHANNELS_PER_PRESET):
+        for channel_idx, bank_prompts in enumerate(preset_prompts):
             bank_samples = []
-            available_prompts = [p for p in prompts if p not in used_prompts]
-
-            # If not enough unique prompts, reuse randomly
-            if len(available_prompts) < SAMPLES_PER_CHANNEL:
-                available_prompts = prompts.copy()
-
-            random.shuffle(available_prompts)
-            bank_prompts = available_prompts[:SAMPLES_PER_CHANNEL]
-
             for idx, prompt in enumerate(bank_prompts):
                 duration = durations[idx]
-                output_base = f"sound_p{preset_idx + 1}_c{channel_idx + 1}_{idx + 1}"
-                output_mp3 = os.path.join(SAMPLES_DIR, f"{output_base}.mp3")
-                output_wav = os.path.join(SAMPLES_DIR, f"{output_base}.wav")
+                output_wav = os.path.join(SAMPLES_DIR, sample_name(preset_idx, channel_idx, idx))
+                bank_samples.append(os.path.basename(output_wav))
 
-                # Skip if WAV already exists to avoid regenerating
-                if os.path.exists(output_wav):
-                    bank_samples.append(os.path.basename(output_wav))
+                # Skip if the slot's WAV already holds this prompt at this duration
+                key = SoundCache.key(prompt, duration, SOUND_SETTINGS)
+                if is_done(journal, bank_samples[-1], key, output_wav, duration):
                     continue
 
-                print(f"Generating: {prompt} ({duration}s) -> {output_wav}")
-                audio_generator = client.text_to_sound_effects.convert(
-                    text=prompt,
-                    duration_seconds=duration
-                )
-                audio_bytes = b"".join(audio_generator)
-
-                # Save as MP3 first
-                with open(output_mp3, "wb") as f:
-                    f.write(audio_bytes)
-
-                # Convert to WAV (default ElevenLabs sample rate, e.g., 44.1kHz)
-                audio = AudioSegment.from_mp3(output_mp3)
-                audio.export(output_wav, format="wav")
-                os.remove(output_mp3)  # Remove temporary MP3
-
-                bank_samples.append(os.path.basename(output_wav))
-                used_prompts.add(prompt)
+                jobs.append(GenerationJob(prompt, duration, output_wav))
+                queued.append((bank_samples[-1], QUEUED, {"key": key, "prompt": prompt, "duration": duration}))
 
             preset_banks.append(bank_samples)
         sample_banks.append(preset_banks)
 
+    # Journal each slot through its states as it goes, so a killed run resumes exactly where it stopped
+    def render_and_record(job, audio_generator):
+        sample = os.path.basename(job.output_wav)
+        journal.record(sample, IN_FLIGHT)
+        render_sample(job, audio_generator)
+        journal.record(sample, COMPLETED)
+        verify_wav(job.output_wav, job.duration)
+        journal.record(sample, VERIFIED, size=os.path.getsize(job.output_wav))
+        return sample
+
+    try:
+        journal.record_many(queued)
+        # The API client (and its key) is only needed when something is left to generate
+        if jobs and generator is None:
+            generator = SoundGenerator(make_client(), max_in_flight=MAX_IN_FLIGHT,
+                                       requests_per_second=REQUESTS_PER_SECOND, max_retries=MAX_RETRIES,
+                                       cache=SoundCache(CACHE_DIR, CACHE_MAX_BYTES), settings=SOUND_SETTINGS)
+        if jobs:
+            generator.run(jobs, render_and_record)
+    finally:
+        journal.close()
+        if generator is not None and generator.cache is not None:
+            generator.cache.save()
+            print(f"Sound cache: {generator.cache.stats()}")
+
     return sample_banks
 
 
-# Generate samples for all presets (64 unique samples per preset)
-sample_banks = generate_sample_banks(NUM_PRESETS)
+# Rebuild the banks from samples already on disk (no API client needed)
+def existing_sample_banks(num_presets):
+    on_disk = set(os.listdir(SAMPLES_DIR)) if os.path.isdir(SAMPLES_DIR) else set()
+    sample_banks = []
+    for preset_idx in range(num_presets):
+        preset_banks = [[sample_name(preset_idx, channel_idx, idx) for idx in range(SAMPLES_PER_CHANNEL)]
+                        for channel_idx in range(CHANNELS_PER_PRESET)]
+        missing = [sample for bank in preset_banks for sample in bank if sample not in on_disk]
+        if missing:
+            print(f"Warning: Preset {preset_idx + 1} is missing {len(missing)} samples (e.g. {missing[0]}). Skipping.")
+            preset_banks = None
+        sample_banks.append(preset_banks)
+    return sample_banks
 
 
-# Custom YAML dumper to remove quotes
-class NoQuotesDumper(yaml.SafeDumper):
-    def represent_str(self, data):
-        return self.represent_scalar('tag:yaml.org,2002:str', data, style='')
+def order_zones(sample_banks):
+    """Sort each bank by ZONE_ORDER_FEATURE (a no-op when it is None)."""
+    if not ZONE_ORDER_FEATURE:
+        return sample_banks
+    from features import FeatureStore, order_by_feature  # NumPy is only needed for feature ordering
 
+    feature_store = FeatureStore(SAMPLES_DIR)
+    feature_store.update([sample for preset_banks in sample_banks if preset_banks
+                          for bank in preset_banks for sample in bank])
+    return [[order_by_feature(bank, feature_store, ZONE_ORDER_FEATURE, ZONE_ORDER_DESCENDING)
+             for bank in preset_banks] if preset_banks else preset_banks for preset_banks in sample_banks]
 
-NoQuotesDumper.add_representer(str, NoQuotesDumper.represent_str)
 
 # Exact working Preset 15 as boilerplate (unchanged)
-preset_template = {
+preset_template = Preset.from_data({
     "Preset 15 ": {
         "Name ": "New",
         "XfadeACV ": "1B",
@@ -313,29 +421,52 @@ preset_template = {
             "Zone 8 ": {"Sample ": "11L-tube_bells-1742491266689.wav", "Side ": 1, "MinVoltage ": "-5.00"}
         }
     }
-}
+})
 
 # Generate presets using the sample banks
-for preset_num in range(1, NUM_PRESETS + 1):
-    preset_key = f"Preset {preset_num} "
-    preset_data = {preset_key: preset_template["Preset 15 "].copy()}
-    preset_data[preset_key]["Name "] = f"Pre{preset_num}"
-
-    # Assign unique bank of 8 samples to each channel
-    preset_banks = sample_banks[preset_num - 1]
-
-    for i in range(CHANNELS_PER_PRESET):
-        channel_key = f"Channel {i + 1} "
-        channel_samples = preset_banks[i]
-        for j in range(SAMPLES_PER_CHANNEL):
-            zone_key = f"Zone {j + 1} "
-            preset_data[preset_key][channel_key][zone_key]["Sample "] = channel_samples[j]
-
-    # Save with prstXXX.yml naming convention
-    output_file = os.path.join(OUTPUT_DIR, f"prst{preset_num:03d}.yml")
-    with open(output_file, "w") as f:
-        yaml.dump(preset_data, f, Dumper=NoQuotesDumper, default_flow_style=False, sort_keys=False)
-
-    print(f"Preset {preset_num} saved to {output_file}")
-
-print("Preset generation complete!")
\ No newline at end of file
+def build_presets(sample_banks):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    written = []
+    for preset_num, preset_banks in enumerate(sample_banks, start=1):
+        if preset_banks is None:
+            continue
+        # Each preset is a copy-on-write overlay, so presets never share (and overwrite) zones
+        preset = preset_template.derive(preset_num)
+        preset.name = f"Pre{preset_num}"
+
+        # Assign unique bank of 8 samples to each channel
+        for i in range(CHANNELS_PER_PRESET):
+            channel = preset.channel(i + 1)
+            channel_samples = preset_banks[i]
+            for j in range(SAMPLES_PER_CHANNEL):
+                channel.zone(j + 1).sample = channel_samples[j]
+
+        # Save with prstXXX.yml naming convention
+        output_file = os.path.join(OUTPUT_DIR, f"prst{preset_num:03d}.yml")
+        preset.save(output_file)
+        written.append(output_file)
+
+        print(f"Preset {preset_num} saved to {output_file}")
+
+    print("Preset generation complete!")
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate sound effect samples and build Assimil8or presets.")
+    parser.add_argument("--presets-only", action="store_true",
+                        help="build presets from the samples already in SAMPLES_DIR (no API client or key)")
+    parser.add_argument("--num-presets", type=int, default=NUM_PRESETS)
+    args = parser.parse_args(argv)
+
+    if args.presets_only:
+        sample_banks = existing_sample_banks(args.num_presets)
+    else:
+        # Generate samples for all presets (64 unique samples per preset)
+        sample_banks = generate_sample_banks(args.num_presets)
+    return build_presets(order_zones(sample_banks))
+
+
+if __name__ == "__main__":
+    with metrics.session("newscript"):
+        main()
\ No newline at end of file
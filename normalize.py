@@ -0,0 +1,234 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import metrics
+from audioio import atomic_output, file_digest
+from pcm import copy_frames, open_pcm, to_float, write_scaled
+from stripSilence import find_silence_bounds
+
+# Directories
+INPUT_DIR = "/Users/mikesidnam/Desktop/Keepers"
+OUTPUT_DIR = "/Users/mikesidnam/Desktop/Keepers/NormalizedKeepers"
+
+# Normalization target
+TARGET_MODE = "lufs"  # "peak" (dBFS), "rms" (dBFS) or "lufs" (integrated loudness, BS.1770 style)
+TARGET_LEVEL = -16.0
+CEILING = -0.3  # dBFS; gain is limited so peaks never exceed this
+TRIM_SILENCE = True  # strip leading/trailing silence in the same pass (see stripSilence.py)
+
+CACHE_FILE = ".loudness.json"  # measurements and applied gains, kept in the output directory
+MODES = ("peak", "rms", "lufs")
+BLOCK_FRAMES = 1 << 18
+
+# ITU-R BS.1770 K-weighting biquads (defined at 48 kHz): high shelf, then high-pass
+_SHELF = ([1.53512485958697, -2.69169618940638, 1.19839281085285], [1.0, -1.69065929318241, 0.73248077421585])
+_HIGHPASS = ([1.0, -2.0, 1.0], [1.0, -1.99004745483398, 0.99007225036621])
+_GATE_BLOCK = 0.4  # seconds
+_GATE_HOP = 0.1  # seconds (75% overlap)
+
+
+def _k_weighting_power(freqs):
+    """|H(f)|^2 of the K-weighting filter, evaluated from the 48 kHz coefficients."""
+    z = np.exp(-1j * 2 * np.pi * np.minimum(freqs, 23999.0) / 48000.0)
+    response = np.ones_like(z)
+    for b, a in (_SHELF, _HIGHPASS):
+        response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.abs(response) ** 2
+
+
+def to_db(value):
+    return 20 * np.log10(value) if value > 0 else -np.inf
+
+
+@metrics.timed("loudness_measure_seconds")
+def measure(info, samples):
+    """
+    Peak, RMS and integrated loudness of opened PCM data (or a frame slice of
+    it) in one block-wise pass.
+
+    Loudness follows BS.1770 (400 ms blocks, 75% overlap, -70 LUFS absolute and
+    -10 LU relative gates), with the K-weighting applied in the frequency domain
+    per block instead of as a time-domain IIR filter.
+
+    Returns:
+        dict: peak_db and rms_db (dBFS) and lufs.
+    """
+    block = max(1, int(_GATE_BLOCK * info.sample_rate))
+    hop = max(1, int(_GATE_HOP * info.sample_rate))
+    weights = _k_weighting_power(np.fft.rfftfreq(block, 1.0 / info.sample_rate))
+    weights[1:(block + 1) // 2] *= 2  # one-sided spectrum
+    peak = 0.0
+    sum_sq = 0.0
+    block_power = []
+    frames = len(samples)
+    # Step through the file so every gating block lies inside one chunk
+    chunk = max(block, (BLOCK_FRAMES // hop) * hop)
+    for start in range(0, max(frames, 1), chunk):
+        x = to_float(samples[start:start + chunk + block - hop], info)
+        if not len(x):
+            break
+        own = x[:chunk]  # frames that belong to this chunk (the rest is overlap for gating)
+        peak = max(peak, float(np.abs(own).max()))
+        sum_sq += float(np.einsum("ij,ij->", own, own))
+        if len(x) >= block:
+            windows = np.lib.stride_tricks.sliding_window_view(x, block, axis=0)[::hop]  # (n, channels, block)
+            windows = windows[:max(0, (min(len(x), chunk + block - hop) - block) // hop + 1)]
+            spectra = np.abs(np.fft.rfft(windows, axis=-1)) ** 2
+            power = (spectra * weights).sum(axis=-1) / (block * block)  # mean square per channel
+            block_power.append(power.sum(axis=1))
+    rms = np.sqrt(sum_sq / (frames * info.channels)) if frames else 0.0
+
+    lufs = -np.inf
+    if block_power:
+        power = np.concatenate(block_power)
+        loudness = -0.691 + 10 * np.log10(np.maximum(power, 1e-20))
+        gated = power[loudness > -70.0]
+        if gated.size:
+            relative = -0.691 + 10 * np.log10(gated.mean()) - 10.0
+            gated = gated[-0.691 + 10 * np.log10(gated) > relative]
+            if gated.size:
+                lufs = -0.691 + 10 * np.log10(gated.mean())
+    return {"peak_db": float(to_db(peak)), "rms_db": float(to_db(rms)), "lufs": float(lufs)}
+
+
+def gain_for(measurement, mode=TARGET_MODE, target=TARGET_LEVEL, ceiling=CEILING):
+    """Gain in dB that brings a measured file to the target, limited by the peak ceiling."""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+    level = measurement[{"peak": "peak_db", "rms": "rms_db", "lufs": "lufs"}[mode]]
+    if not np.isfinite(level):
+        return 0.0  # digital silence: leave it alone
+    gain = target - level
+    if np.isfinite(measurement["peak_db"]):
+        gain = min(gain, ceiling - measurement["peak_db"])
+    return round(float(gain), 4)
+
+
+def process_file(input_path, output_path, measurement=None, mode=TARGET_MODE, target=TARGET_LEVEL,
+                 ceiling=CEILING, trim=TRIM_SILENCE):
+    """
+    Normalize (and optionally trim) one WAV in a single job over one memory map:
+    unless a cached measurement is given, find the silence bounds and measure
+    the region between them, then write that region scaled by the gain.
+
+    Returns:
+        (dict, float): The measurement (including the kept frame range) and the gain in dB.
+    """
+    info, samples = open_pcm(input_path)
+    if measurement is None:
+        start, end = find_silence_bounds(info, samples) if trim else (0, info.frames)
+        measurement = dict(measure(info, samples[start:end]), start=start, end=end)
+    gain_db = gain_for(measurement, mode, target, ceiling)
+    if gain_db == 0.0:
+        copy_frames(input_path, info, output_path, measurement["start"], measurement["end"])
+    else:
+        write_scaled(info, samples, output_path, measurement["start"], measurement["end"], 10 ** (gain_db / 20.0))
+    return measurement, gain_db
+
+
+def _process_one(args):
+    name, input_path, output_path, measurement, settings = args
+    try:
+        return (name,) + process_file(input_path, output_path, measurement, **settings) + (None,)
+    except Exception as e:
+        return name, None, None, e
+
+
+class LoudnessCache:
+    """
+    JSON cache of per-file measurements (keyed by content hash and trim
+    setting, with a name -> size/mtime/hash memo) and of what was last written
+    for each output.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {}
+        self.files = data.get("files", {})
+        self.measurements = data.get("measurements", {})
+        self.applied = data.get("applied", {})
+
+    def content_hash(self, name, path):
+        st = os.stat(path)
+        known = self.files.get(name)
+        if known is None or known[:2] != [st.st_size, st.st_mtime_ns]:
+            known = [st.st_size, st.st_mtime_ns, file_digest(path)]
+            self.files[name] = known
+        return known[2]
+
+    def save(self):
+        with atomic_output(self.path) as tmp_path:
+            with open(tmp_path, "w") as f:
+                json.dump({"files": self.files, "measurements": self.measurements, "applied": self.applied}, f)
+
+
+def normalize_directory(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR, mode=TARGET_MODE, target=TARGET_LEVEL,
+                        ceiling=CEILING, trim=TRIM_SILENCE, workers=None):
+    """
+    Normalize every WAV in `input_dir` into `output_dir` across a process pool.
+
+    Measurements are cached per source content, so changing the target only
+    rescales; files whose output already carries the right gain are skipped.
+
+    Returns:
+        dict: Counts of processed, skipped, measured and failed files and elapsed seconds.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cache = LoudnessCache(os.path.join(output_dir, CACHE_FILE))
+    settings = {"mode": mode, "target": target, "ceiling": ceiling, "trim": trim}
+    summary = {"processed": 0, "skipped": 0, "measured": 0, "failed": 0, "failed_files": [], "elapsed": 0.0}
+    start = time.perf_counter()
+
+    tasks = []
+    keys = {}  # name -> measurement key
+    for name in sorted(f for f in os.listdir(input_dir) if f.lower().endswith(".wav")):
+        input_path = os.path.join(input_dir, name)
+        output_path = os.path.join(output_dir, name)
+        digest = cache.content_hash(name, input_path)
+        key = keys[name] = f"{digest}:trim" if trim else digest
+        measurement = cache.measurements.get(key)
+        applied = cache.applied.get(name)
+        if measurement is not None and applied is not None and os.path.exists(output_path):
+            expected = {"source": key, "gain_db": gain_for(measurement, mode, target, ceiling), "trim": trim,
+                        "output_size": os.path.getsize(output_path)}
+            if all(applied.get(field) == value for field, value in expected.items()):
+                summary["skipped"] += 1
+                continue
+        if measurement is None:
+            summary["measured"] += 1
+        tasks.append((name, input_path, output_path, measurement, settings))
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for name, measurement, gain_db, error in metrics.map_collected(pool, _process_one, tasks, chunksize=8):
+                if error is not None:
+                    print(f"Error processing {name}: {error}")
+                    summary["failed"] += 1
+                    summary["failed_files"].append(name)
+                    continue
+                key = keys[name]
+                cache.measurements[key] = measurement
+                cache.applied[name] = {"source": key, "gain_db": gain_db, "trim": trim,
+                                       "output_size": os.path.getsize(os.path.join(output_dir, name))}
+                summary["processed"] += 1
+                print(f"Processed: {name} ({gain_db:+.2f} dB)")
+    finally:
+        cache.save()
+
+    summary["elapsed"] = time.perf_counter() - start
+    print(f"Processed {summary['processed']} files ({summary['measured']} measured), "
+          f"skipped {summary['skipped']}, {summary['failed']} failed in {summary['elapsed']:.1f}s")
+    return summary
+
+
+if __name__ == "__main__":
+    with metrics.session("normalize"):
+        normalize_directory(INPUT_DIR, OUTPUT_DIR)
@@ -0,0 +1,131 @@
+import struct
+
+import numpy as np
+
+import metrics
+from audioio import WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, WavFormatError, atomic_output, read_wav_info
+
+COPY_CHUNK = 1024 * 1024
+
+_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.uint8,
+    (WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+    (WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype("<f8"),
+}
+
+
+def open_pcm(path, info=None):
+    """
+    Memory-map a WAV file's PCM data.
+
+    Returns:
+        (WavInfo, ndarray): The header and a read-only array of shape
+            (frames, channels), or (frames, channels, 3) of raw bytes for 24-bit audio.
+            Use to_float() to turn any slice of it into normalized samples.
+    """
+    info = info or read_wav_info(path)
+    if info.format_tag == WAVE_FORMAT_PCM and info.bits == 24:
+        dtype, shape = np.uint8, (info.frames, info.channels, 3)
+    else:
+        dtype = _DTYPES.get((info.format_tag, info.bits))
+        if dtype is None:
+            raise WavFormatError(f"{path}: unsupported sample format ({info.format_tag:#x}, {info.bits} bit)")
+        shape = (info.frames, info.channels)
+    if info.frames == 0:
+        return info, np.zeros(shape, dtype=dtype)
+    return info, np.memmap(path, dtype=dtype, mode="r", offset=info.data_offset, shape=shape)
+
+
+def to_float(block, info):
+    """Convert a slice of an open_pcm() array to float64 samples in [-1, 1]."""
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        return np.asarray(block, dtype=np.float64)
+    if info.bits == 8:
+        return (np.asarray(block, dtype=np.float64) - 128.0) / 128.0
+    if info.bits == 24:
+        raw = np.asarray(block, dtype=np.int32)
+        values = raw[..., 0] | (raw[..., 1] << 8) | (raw[..., 2] << 16)
+        values = np.where(values & 0x800000, values - 0x1000000, values)
+        return values / float(1 << 23)
+    return np.asarray(block, dtype=np.float64) / float(1 << (info.bits - 1))
+
+
+def from_float(samples, info):
+    """Inverse of to_float(): clip and quantize float samples to the file's sample format."""
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        return np.asarray(samples, dtype=_DTYPES[(info.format_tag, info.bits)])
+    scale = float(1 << (info.bits - 1))
+    values = np.clip(np.round(samples * scale), -scale, scale - 1)
+    if info.bits == 8:
+        return (values + 128).astype(np.uint8)
+    if info.bits == 24:
+        values = values.astype("<i4")
+        return values.reshape(values.shape + (1,)).view(np.uint8)[..., :3]
+    return values.astype(_DTYPES[(info.format_tag, info.bits)])
+
+
+def wav_header(format_tag, channels, sample_rate, bits, data_size):
+    """Canonical 44-byte RIFF/WAVE header for `data_size` bytes of interleaved samples."""
+    block_align = channels * bits // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size + (data_size % 2), b"WAVE",
+        b"fmt ", 16, format_tag, channels, sample_rate, sample_rate * block_align, block_align, bits,
+        b"data", data_size
+    )
+
+
+@metrics.timed("wav_copy_seconds")
+def copy_frames(input_path, info, output_path, start, end):
+    """
+    Write frames [start, end) of `input_path` to a new WAV by copying the raw
+    byte range behind a fresh header - no decoding or re-encoding.
+    """
+    start = max(0, min(start, info.frames))
+    end = max(start, min(end, info.frames))
+    remaining = (end - start) * info.block_align
+    with atomic_output(output_path) as tmp_path:
+        with open(input_path, "rb") as src, open(tmp_path, "wb") as dst:
+            dst.write(wav_header(info.format_tag, info.channels, info.sample_rate, info.bits, remaining))
+            src.seek(info.data_offset + start * info.block_align)
+            while remaining > 0:
+                chunk = src.read(min(COPY_CHUNK, remaining))
+                if not chunk:
+                    break
+                dst.write(chunk)
+                remaining -= len(chunk)
+            if (end - start) * info.block_align % 2:
+                dst.write(b"\x00")  # RIFF pad byte
+
+
+def block_mean_square(block, info, block_frames):
+    """
+    Mean square of consecutive `block_frames`-long blocks of an open_pcm() slice,
+    over all channels (the last block may be shorter).
+    """
+    samples = to_float(block, info)
+    energy = np.einsum("ij,ij->i", samples, samples)
+    starts = np.arange(0, len(energy), block_frames)
+    counts = np.minimum(block_frames, len(energy) - starts) * info.channels
+    return np.add.reduceat(energy, starts) / counts
+
+
+@metrics.timed("wav_write_seconds")
+def write_scaled(info, samples, output_path, start, end, gain, block_frames=1 << 18):
+    """
+    Write frames [start, end) of open_pcm() data multiplied by `gain` to a new WAV
+    in the same sample format, one block at a time.
+    """
+    start = max(0, min(start, info.frames))
+    end = max(start, min(end, info.frames))
+    data_size = (end - start) * info.block_align
+    with atomic_output(output_path) as tmp_path:
+        with open(tmp_path, "wb") as dst:
+            dst.write(wav_header(info.format_tag, info.channels, info.sample_rate, info.bits, data_size))
+            for pos in range(start, end, block_frames):
+                block = to_float(samples[pos:min(end, pos + block_frames)], info)
+                dst.write(from_float(block * gain, info).tobytes())
+            if data_size % 2:
+                dst.write(b"\x00")  # RIFF pad byte
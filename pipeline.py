@@ -0,0 +1,285 @@
+import argparse
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from audioio import decode_mp3_stream
+from bankassign import BankAssigner
+from mp3towavscript import convert_file
+from newscript import make_client
+from presetgen import build_preset, load_template
+from sampleindex import SampleIndex
+from samplecache import SoundCache
+from soundgen import GenerationJob, SoundGenerator
+from stripSilence import strip_silence
+
+QUEUE_SIZE = 64  # items buffered between two stages before the producer blocks
+SAMPLES_PER_PRESET = 64  # 8 channels * 8 zones
+
+_DONE = object()  # end-of-stream marker passed down the queues
+
+
+class Stage:
+    """
+    A pool of worker threads between two bounded queues.
+
+    Each item taken from the inbox is passed to `func`; a result other than None
+    is put on the next stage's inbox. Because the queues are bounded, a slow
+    stage blocks its producers once its inbox is full (backpressure). A failure
+    only drops the item that caused it.
+
+    Args:
+        name (str): Label used in logs and stats.
+        func: Callable applied to every item.
+        workers (int): Worker threads for this stage.
+        queue_size (int): Capacity of this stage's inbox.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=QUEUE_SIZE):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.inbox = queue.Queue(queue_size)
+        self.outbox = None
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._running = 0
+        self._threads = []
+
+    def start(self):
+        self._running = self.workers
+        self._threads = [threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                with self._lock:
+                    self._running -= 1
+                    last = self._running == 0
+                if not last:
+                    self.inbox.put(_DONE)  # let the sibling workers see it too
+                elif self.outbox is not None:
+                    self.outbox.put(_DONE)
+                return
+            start = time.perf_counter()
+            try:
+                result = self.func(item)
+            except Exception as e:
+                print(f"[{self.name}] failed on {item}: {e}")
+                result = None
+                with self._lock:
+                    self.failed += 1
+            else:
+                with self._lock:
+                    self.processed += 1
+            with self._lock:
+                self.busy_seconds += time.perf_counter() - start
+            if result is not None and self.outbox is not None:
+                self.outbox.put(result)
+
+    def stats(self):
+        return {"workers": self.workers, "processed": self.processed, "failed": self.failed,
+                "busy_seconds": round(self.busy_seconds, 3)}
+
+
+class Pipeline:
+    """Stages connected in order; run() feeds the first stage and waits for the last."""
+
+    def __init__(self, stages):
+        self.stages = stages
+        for upstream, downstream in zip(stages, stages[1:]):
+            upstream.outbox = downstream.inbox
+
+    def run(self, items):
+        start = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+        for item in items:
+            self.stages[0].inbox.put(item)
+        self.stages[0].inbox.put(_DONE)
+        for stage in self.stages:
+            stage.join()
+        stats = {stage.name: stage.stats() for stage in self.stages}
+        stats["elapsed"] = round(time.perf_counter() - start, 3)
+        return stats
+
+
+class PresetEmitter:
+    """
+    Final stage: collects indexed samples and writes a preset as soon as enough
+    unused samples exist to fill all of its banks.
+
+    Args:
+        template_file (str): prstXXX.yml used as the preset template.
+        output_dir (str): Where the prstXXX.yml files go.
+        same_length (bool): Fill each channel with samples of one frame length.
+        first_preset (int): Number of the first preset written.
+    """
+
+    def __init__(self, template_file, output_dir, same_length=False, first_preset=1):
+        _, self.template = load_template(template_file)
+        self.output_dir = output_dir
+        self.same_length = same_length
+        self.next_preset = first_preset
+        self.written = []
+        self.assigner = BankAssigner({}, distinct_groups=same_length, unique_across=None, strict=True)
+        self._pending = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def __call__(self, sample):
+        name, frames = sample
+        self.assigner.add(name, frames if self.same_length else None)
+        self._pending += 1
+        while self.assigner.can_fill():
+            self.emit(self.assigner.assign_preset())
+
+    def emit(self, banks):
+        preset_num = self.next_preset
+        output_file = os.path.join(self.output_dir, f"prst{preset_num:03d}.yml")
+        build_preset(preset_num, self.template, banks).save(output_file)
+        print(f"Preset {preset_num} saved to {output_file}")
+        self.written.append(output_file)
+        self.next_preset += 1
+        self._pending = max(0, self._pending - SAMPLES_PER_PRESET)
+
+    def finish(self, emit_partial=False):
+        """Write one last preset from leftover samples (reusing some) if asked to."""
+        if emit_partial and self._pending:
+            self.assigner.strict = False
+            self.emit(self.assigner.assign_preset())
+        return self.written
+
+
+def slugify(text, length=24):
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_")[:length] or "sample"
+
+
+def build_pipeline(args, emitter):
+    generated_dir = os.path.join(args.work_dir, "generated")
+    decoded_dir = os.path.join(args.work_dir, "decoded")
+    for directory in (generated_dir, decoded_dir, args.samples_dir):
+        os.makedirs(directory, exist_ok=True)
+    stages = []
+
+    if args.prompts:
+        generator = SoundGenerator(args.client or make_client(), max_in_flight=args.generate_workers,
+                                   cache=SoundCache(os.path.join(args.work_dir, ".soundcache")))
+
+        def generate(job):
+            generator.process(job, lambda job, chunks: decode_mp3_stream(chunks, job.output_wav))
+            return job.output_wav
+
+        stages.append(Stage("generate", generate, args.generate_workers, args.queue_size))
+    else:
+        def decode(path):
+            if not path.lower().endswith(".mp3"):
+                return path
+            output = os.path.join(decoded_dir, os.path.splitext(os.path.basename(path))[0] + ".wav")
+            convert_file(path, output)
+            return output
+
+        stages.append(Stage("decode", decode, args.decode_workers, args.queue_size))
+
+    processes = ProcessPoolExecutor(args.trim_processes) if args.trim_processes else None
+
+    def trim(path):
+        output = os.path.join(args.samples_dir, os.path.basename(path))
+        if args.no_trim:
+            if os.path.abspath(path) != os.path.abspath(output):
+                shutil.copyfile(path, output)
+            return output
+        if processes is not None:
+            metrics.unwrap(processes.submit(metrics.collected(strip_silence), path, output).result())
+        else:
+            strip_silence(path, output)
+        return output
+
+    stages.append(Stage("trim", trim, args.trim_workers, args.queue_size))
+
+    # SQLite connections belong to the thread that made them, so the single index worker opens its own
+    local = threading.local()
+
+    def index(path):
+        if not hasattr(local, "index"):
+            local.index = SampleIndex(args.samples_dir)
+        info = local.index.update(os.path.basename(path))
+        if info["frames"] is None:
+            return None
+        return info["path"], info["frames"]
+
+    stages.append(Stage("index", index, 1, args.queue_size))
+    stages.append(Stage("emit", emitter, 1, args.queue_size))
+    return Pipeline(stages), processes
+
+
+def source_items(args):
+    if args.prompts:
+        with open(args.prompts, "r") as f:
+            prompts = [line.strip() for line in f if line.strip()]
+        generated_dir = os.path.join(args.work_dir, "generated")
+        for i, prompt in enumerate(prompts):
+            duration = args.durations[i % len(args.durations)]
+            yield GenerationJob(prompt, duration, os.path.join(generated_dir, f"{slugify(prompt)}_{i:05d}.wav"))
+    else:
+        for name in sorted(os.listdir(args.ingest)):
+            if name.lower().endswith((".mp3", ".wav")):
+                yield os.path.join(args.ingest, name)
+
+
+def run(args):
+    emitter = PresetEmitter(args.template, args.presets_dir, args.same_length, args.first_preset)
+    pipeline, processes = build_pipeline(args, emitter)
+    try:
+        stats = pipeline.run(source_items(args))
+    finally:
+        if processes is not None:
+            processes.shutdown()
+    emitter.finish(args.emit_partial)
+    stats["presets"] = len(emitter.written)
+    print(f"Pipeline finished in {stats['elapsed']}s: {stats}")
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or ingest samples, trim, index and build presets in one pass.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--prompts", help="text file with one sound effect prompt per line (generates via the API)")
+    source.add_argument("--ingest", help="directory of existing MP3/WAV files")
+    parser.add_argument("--samples-dir", required=True, help="where trimmed, indexed samples are written")
+    parser.add_argument("--presets-dir", required=True, help="where prstXXX.yml files are written")
+    parser.add_argument("--template", default="prst001.yml", help="preset template")
+    parser.add_argument("--work-dir", help="scratch space for generated/decoded audio (default: <samples-dir>/.work)")
+    parser.add_argument("--durations", type=float, nargs="+", default=[10, 8, 12, 6])
+    parser.add_argument("--generate-workers", type=int, default=4, help="concurrent API requests")
+    parser.add_argument("--decode-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--trim-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--trim-processes", type=int, default=0, help="run trimming in a process pool of this size")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--no-trim", action="store_true", help="copy samples without stripping silence")
+    parser.add_argument("--same-length", action="store_true", help="fill each channel with same-length samples")
+    parser.add_argument("--emit-partial", action="store_true", help="write a final preset from leftover samples")
+    parser.add_argument("--first-preset", type=int, default=1)
+    args = parser.parse_args(argv)
+    args.work_dir = args.work_dir or os.path.join(args.samples_dir, ".work")
+    args.client = None
+    return args
+
+
+if __name__ == "__main__":
+    with metrics.session("pipeline"):
+        run(parse_args())
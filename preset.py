@@ -0,0 +1,377 @@
+import sys
+from collections.abc import MutableMapping
+
+import metrics
+from presetio import INDENT, PresetFormatError, loads_preset, read_preset
+
+KEY_SUFFIX = " "  # every key in a prstXXX.yml is followed by a space before its colon
+
+_MISSING = object()
+_DELETED = object()
+_NODE_TYPES = set()  # exact-type checks; isinstance() against an ABC subclass is slow on the dump path
+_KEYS = {}
+_generation = 0  # bumped by every edit of a base (non-overlay) node; invalidates cached renderings
+
+
+def _key(name):
+    # Interned, so thousands of overlays share one copy of each key string
+    key = _KEYS.get(name)
+    if key is None:
+        key = _KEYS[name] = sys.intern(name if name.endswith(KEY_SUFFIX) else name + KEY_SUFFIX)
+    return key
+
+
+def _is_node(value):
+    return type(value) in _NODE_TYPES
+
+
+def _edited():
+    global _generation
+    _generation += 1
+
+
+class Node(MutableMapping):
+    """
+    One section of a preset file: an ordered mapping of keys to values or
+    nested sections, optionally layered over a base section.
+
+    A node derived from a base (see derive()) stores only its own changes;
+    everything else is read through from the base. Nested sections are
+    copied on first access, as empty overlays, so writing to them never
+    touches the base. Keys may be given with or without the file's trailing
+    space ("PitchCV" and "PitchCV " are the same key).
+
+    Subclasses may list keys in _FIELDS that overlays keep in a slot rather
+    than in a dict, for values nearly every derived node overrides.
+    """
+
+    # _values stays None until the node holds a value of its own; _rendered caches a base node's rendering
+    __slots__ = ("_base", "_values", "_rendered")
+    _FIELDS = {}  # file key -> slot name
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _NODE_TYPES.add(cls)
+
+    def __init__(self, values=None, base=None):
+        self._base = base
+        self._values = values
+        self._rendered = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a node tree from nested dicts as returned by presetio.loads_preset."""
+        values = {}
+        for key, value in data.items():
+            key = _key(key)
+            values[key] = _section_type(key).from_dict(value) if isinstance(value, dict) else value
+        return cls(values)
+
+    def derive(self):
+        """A copy-on-write overlay of this node."""
+        node = object.__new__(type(self))
+        node._base = self
+        node._values = None
+        node._rendered = None
+        return node
+
+    def _own(self, key):
+        slot = self._FIELDS.get(key)
+        if slot is not None:
+            value = getattr(self, slot, _MISSING)
+            if value is not _MISSING:
+                return value
+        values = self._values
+        return _MISSING if values is None else values.get(key, _MISSING)
+
+    def _own_values(self):
+        own = self._values
+        for key, slot in self._FIELDS.items():
+            value = getattr(self, slot, _MISSING)
+            if value is not _MISSING:
+                own = {**own, key: value} if own else {key: value}
+        return own
+
+    def _store(self, key, value):
+        if self._base is None:
+            _edited()
+        slot = self._FIELDS.get(key)
+        if slot is not None and (self._values is None or key not in self._values):
+            setattr(self, slot, value)
+        elif self._values is None:
+            self._values = {key: value}
+        else:
+            self._values[key] = value
+
+    def _raw(self, key):
+        node = self
+        while node is not None:
+            value = node._own(key)
+            if value is not _MISSING:
+                return value
+            node = node._base
+        return _MISSING
+
+    def _raw_items(self):
+        # (key, value) pairs in file order, without materializing copies of untouched sections
+        own = self._own_values()
+        if self._base is None:
+            return own.items() if own else ()  # only overlays record deletions
+        items = self._base._raw_items()
+        if not own:
+            return items
+        merged = []
+        found = 0
+        for key, value in items:
+            mine = own.get(key, _MISSING)
+            if mine is _MISSING:
+                merged.append((key, value))
+            else:
+                found += 1
+                if mine is not _DELETED:
+                    merged.append((key, mine))
+        if found < len(own):  # keys added by this overlay go last
+            inherited = {key for key, _ in items}
+            merged.extend((key, value) for key, value in own.items() if key not in inherited and value is not _DELETED)
+        return merged
+
+    def __getitem__(self, key):
+        key = _key(key)
+        value = self._own(key)
+        if value is _MISSING and self._base is not None:
+            value = self._base._raw(key)
+            if _is_node(value):
+                value = value.derive()
+                self._store(key, value)
+        if value is _MISSING or value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        key = _key(key)
+        if isinstance(value, dict):
+            value = _section_type(key).from_dict(value)
+        self._store(key, value)
+
+    def __delitem__(self, key):
+        key = _key(key)
+        if key not in self:
+            raise KeyError(key)
+        if self._base is None:
+            _edited()
+        if self._base is not None and key in self._base:
+            self._store(key, _DELETED)
+        elif key in self._FIELDS and getattr(self, self._FIELDS[key], _MISSING) is not _MISSING:
+            delattr(self, self._FIELDS[key])
+        else:
+            del self._values[key]
+
+    def __contains__(self, key):
+        value = self._raw(_key(key))
+        return value is not _MISSING and value is not _DELETED
+
+    def __iter__(self):
+        for key, _ in self._raw_items():
+            yield key
+
+    def __len__(self):
+        return len(self._raw_items())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self):
+        """Plain nested dicts (file keys, trailing spaces included)."""
+        return {key: value.to_dict() if _is_node(value) else value for key, value in self._raw_items()}
+
+    def changes(self):
+        """
+        Nested dict of what this overlay changes relative to its base (deleted
+        keys map to None); the whole content for a node without a base.
+        """
+        if self._base is None:
+            return self.to_dict()
+        diff = {}
+        for key, value in (self._own_values() or {}).items():
+            if value is _DELETED:
+                diff[key] = None
+            elif _is_node(value) and value._base is self._base._raw(key):
+                nested = value.changes()
+                if nested:
+                    diff[key] = nested
+            else:
+                diff[key] = value.to_dict() if _is_node(value) else value
+        return diff
+
+    def sections(self, prefix):
+        """Nested sections whose key starts with `prefix` (e.g. "Zone "), in file order."""
+        return [self[key] for key, value in self._raw_items() if key.startswith(prefix) and _is_node(value)]
+
+
+_NODE_TYPES.add(Node)
+_SAMPLE = _key("Sample")
+
+
+class Zone(Node):
+    __slots__ = ("_sample",)
+    _FIELDS = {_SAMPLE: "_sample"}
+
+    @property
+    def sample(self):
+        return self.get("Sample")
+
+    @sample.setter
+    def sample(self, name):
+        self._store(_SAMPLE, name)
+
+    @property
+    def min_voltage(self):
+        return self.get("MinVoltage")
+
+    @min_voltage.setter
+    def min_voltage(self, value):
+        self["MinVoltage"] = value
+
+
+class Channel(Node):
+    __slots__ = ()
+
+    def zone(self, number):
+        return self[f"Zone {number}"]
+
+    def zones(self):
+        return self.sections("Zone ")
+
+
+class Preset(Node):
+    """
+    A whole prstXXX.yml: the "Preset N" section plus its number.
+
+    Presets generated from a template are overlays of it, so a preset that only
+    changes its name and 64 samples stores just those values, and bulk edits
+    made on the template show through in every preset derived from it.
+    """
+
+    __slots__ = ("number",)
+
+    def __init__(self, values=None, base=None, number=1):
+        super().__init__(values, base)
+        self.number = number
+
+    @classmethod
+    def from_data(cls, preset_data):
+        """Build a Preset from the {"Preset N ": {...}} dict presetio reads and writes."""
+        if len(preset_data) != 1:
+            raise PresetFormatError(f"Expected a single top-level preset key, got {list(preset_data)}")
+        (key, body), = preset_data.items()
+        words = key.split()
+        if len(words) != 2 or words[0] != "Preset" or not words[1].isdigit():
+            raise PresetFormatError(f"Top-level key should look like 'Preset N ', got {key!r}")
+        preset = cls.from_dict(body)
+        preset.number = int(words[1])
+        return preset
+
+    @classmethod
+    def loads(cls, text):
+        return cls.from_data(loads_preset(text))
+
+    @classmethod
+    def read(cls, path):
+        return cls.from_data(read_preset(path))
+
+    def derive(self, number=None):
+        return type(self)(base=self, number=self.number if number is None else number)
+
+    @property
+    def key(self):
+        return f"Preset {self.number}{KEY_SUFFIX}"
+
+    @property
+    def name(self):
+        return self.get("Name")
+
+    @name.setter
+    def name(self, value):
+        self["Name"] = value
+
+    def channel(self, number):
+        return self[f"Channel {number}"]
+
+    def channels(self):
+        return self.sections("Channel ")
+
+    def to_data(self):
+        """The {"Preset N ": {...}} dict form used by presetio."""
+        return {self.key: self.to_dict()}
+
+    @metrics.timed("preset_dump_seconds")
+    def dumps(self):
+        """Render in the prstXXX.yml layout (same output as presetio.dumps_preset(self.to_data()))."""
+        return f"{self.key}:\n" + "".join(_pieces(self, 1)[1])
+
+    @metrics.timed("preset_save_seconds")
+    def save(self, path):
+        with open(path, "w", buffering=64 * 1024) as f:
+            f.write(self.dumps())
+
+
+_SECTION_TYPES = (("Channel ", Channel), ("Zone ", Zone))
+
+
+def _section_type(key):
+    for prefix, section_type in _SECTION_TYPES:
+        if key.startswith(prefix):
+            return section_type
+    return Node
+
+
+def _line(indent, key, value):
+    if value is None:
+        return f"{indent}{key}:\n"
+    text = str(value)
+    if "\n" in text:
+        raise PresetFormatError(f"Value for {key!r} spans several lines: {text!r}")
+    return f"{indent}{key}: {text}\n"
+
+
+def _piece(node_key, value, depth):
+    # The rendered text of one key, nested sections included
+    indent = INDENT * depth
+    if type(value) in _NODE_TYPES:
+        return f"{indent}{node_key}:\n" + "".join(_pieces(value, depth + 1)[1])
+    return _line(indent, node_key, value)
+
+
+def _pieces(node, depth):
+    """
+    ({key: position}, [rendered text per key]) for a node. Base nodes keep
+    theirs until any base node is edited, so rendering an overlay copies its
+    base's list and re-renders only the keys the overlay owns.
+    """
+    base = node._base
+    if base is None:
+        cached = node._rendered
+        if cached is None or cached[:2] != (_generation, depth):
+            items = list(node._raw_items())
+            cached = node._rendered = (_generation, depth, {key: i for i, (key, _) in enumerate(items)},
+                                       [_piece(key, value, depth) for key, value in items])
+        return cached[2], cached[3]
+    index, pieces = _pieces(base, depth)
+    own = node._own_values()
+    if not own:
+        return index, pieces
+    pieces = list(pieces)
+    added = None
+    for key, value in own.items():
+        position = index.get(key) if added is None else added.get(key)
+        if value is _DELETED:
+            if position is not None:
+                pieces[position] = ""
+        elif position is not None:
+            pieces[position] = _piece(key, value, depth)
+        else:  # a key the base doesn't have goes last
+            if added is None:
+                added = dict(index)
+            added[key] = len(pieces)
+            pieces.append(_piece(key, value, depth))
+    return index if added is None else added, pieces
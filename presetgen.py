@@ -1,111 +1,150 @@
 import os
 import random
-import yaml
-import wave
-from collections import defaultdict
-import copy
+
+import metrics
+from bankassign import BankAssigner
+from features import FeatureStore, order_by_feature
+from fingerprint import FingerprintStore
+from preset import Preset
+from presetio import PresetFormatError
+from sampleindex import SampleIndex
 
 # Directory containing samples
 SAMPLES_DIR = "/Users/mikesidnam/Desktop/Keepers/NormalizedKeepers"
 OUTPUT_DIR = "/Users/mikesidnam/Desktop/EditedKeepers"
 NUM_PRESETS = 10
+SEED = None  # seed the sample draws to make a run reproducible (None = different every run)
 TEMPLATE_FILE = "/Users/mikesidnam/PycharmProjects/pythonProject5/prst001.yml"  # Path to your template YAML file
 
-# Ensure output directory exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-# Scan the directory for sample files and group by length
-all_samples = [f for f in os.listdir(SAMPLES_DIR) if f.endswith(".wav")]
-if len(all_samples) < 64:  # 8 channels * 8 zones = 64 samples minimum
-    print("Warning: Fewer than 64 samples available. Duplicates may occur.")
-
-# Group samples by length (optional, for same-length preference)
-sample_groups = defaultdict(list)
-for sample in all_samples:
-    sample_path = os.path.join(SAMPLES_DIR, sample)
-    try:
-        with wave.open(sample_path, 'rb') as wav_file:
-            length = wav_file.getnframes()
-            sample_groups[length].append(sample)
-    except wave.Error:
-        print(f"Error reading {sample}. Skipping.")
-
-
-# Custom YAML dumper to remove quotes from all strings
-class NoQuotesDumper(yaml.SafeDumper):
-    def represent_str(self, data):
-        return self.represent_scalar('tag:yaml.org,2002:str', data, style='')
+# Sample assignment constraints
+UNIQUE_ACROSS_PRESETS = 1  # a sample is not reused within this many consecutive presets (None = never)
+MAX_SAMPLE_REUSE = None  # retire a sample after this many uses (None = unlimited)
+# Keep audibly identical samples (see fingerprint.py) out of the same bank. Off by default: the first run with it
+# on decodes and fingerprints the whole library (later runs only fingerprint new or changed files)
+REJECT_NEAR_DUPLICATES = False
 
+# Zone ordering: sort each channel's samples by a cached audio feature (see features.FEATURES), None = random
+ZONE_ORDER_FEATURE = None  # e.g. "centroid" to sweep from bright (Zone 1, +4.52) to dark (Zone 8, -5.00)
+ZONE_ORDER_DESCENDING = True
 
-NoQuotesDumper.add_representer(str, NoQuotesDumper.represent_str)
 
-
-# Load the preset template from a YAML file
+# Load the preset template from a prstXXX.yml file (a single top-level preset key, e.g. "Preset 15 ")
 def load_template(template_path):
     try:
-        with open(template_path, 'r') as f:
-            template = yaml.safe_load(f)
-        # Assuming the template has a single top-level preset key (e.g., "Preset 15 ")
-        preset_key = list(template.keys())[0]  # Get the first (and only) preset key
-        return preset_key, template[preset_key]
+        template = Preset.read(template_path)
+        return template.key, template
     except FileNotFoundError:
         print(f"Error: Template file '{template_path}' not found.")
         raise
-    except yaml.YAMLError as e:
-        print(f"Error parsing YAML file: {e}")
+    except PresetFormatError as e:
+        print(f"Error parsing preset file: {e}")
         raise
     except Exception as e:
         print(f"Unexpected error loading template: {e}")
         raise
 
 
-# Load the template
-template_key, preset_template = load_template(TEMPLATE_FILE)
+def make_assigner(sample_index, conflicts=None, rng=None):
+    """Bank assigner over the indexed library, preferring same-length groups."""
+    all_samples = sample_index.all_samples()
+    if len(all_samples) < 64:  # 8 channels * 8 zones = 64 samples minimum
+        print("Warning: Fewer than 64 samples available. Duplicates may occur.")
+
+    # Group samples by length (optional, for same-length preference)
+    sample_groups = sample_index.length_groups(min_size=8)
+    if len(sample_groups) >= 8:
+        # Use same-length groups if possible, a different length for each channel
+        return BankAssigner(sample_groups, distinct_groups=True, unique_across=UNIQUE_ACROSS_PRESETS,
+                            max_reuse=MAX_SAMPLE_REUSE, conflicts=conflicts, rng=rng)
+    # Fall back to fully random selection from all samples
+    return BankAssigner(all_samples, unique_across=UNIQUE_ACROSS_PRESETS, max_reuse=MAX_SAMPLE_REUSE,
+                        conflicts=conflicts, rng=rng)
 
-# Generate presets
-for preset_num in range(1, NUM_PRESETS + 1):
-    # Deep copy the template and rename the preset key
-    preset_key = f"Preset {preset_num} "
-    preset_data = {preset_key: copy.deepcopy(preset_template)}  # Use deep copy to avoid modifying the template
-    preset_data[preset_key]["Name"] = f"Pre{preset_num}"
 
-    # Flatten sample groups into a single list if same-length grouping isn’t viable
-    valid_groups = [group for length, group in sample_groups.items() if len(group) >= 8]
-    if len(valid_groups) >= 8:
-        # Use same-length groups if possible
-        random.shuffle(valid_groups)
-        selected_groups = valid_groups[:8]
-    else:
-        # Fall back to fully random selection
-        selected_groups = [all_samples] * 8  # Use all samples for each channel
+def build_preset(preset_num, preset_template, preset_banks):
+    """Fill a copy-on-write overlay of the template with one bank of samples per channel."""
+    preset = preset_template.derive(preset_num)
+    preset.name = f"Pre{preset_num}"
 
     # Assign random WAVs to each channel’s zones
     for i in range(8):
-        channel_key = f"Channel {i + 1}"
-        if channel_key not in preset_data[preset_key]:
+        channel_key = f"Channel {i + 1} "
+        channel = preset.get(channel_key)
+        if channel is None:
             print(f"Warning: {channel_key} not found in template for preset {preset_num}. Skipping.")
             continue
 
-        group_samples = selected_groups[i].copy()
-        random.shuffle(group_samples)
-
-        # Ensure we have enough samples, repeat if necessary
-        while len(group_samples) < 8:
-            group_samples.extend(group_samples[:8 - len(group_samples)])
-        zones_samples = group_samples[:8]
+        zones_samples = preset_banks[i]
 
         for j in range(8):
-            zone_key = f"Zone {j + 1}"
-            if zone_key not in preset_data[preset_key][channel_key]:
+            zone_key = f"Zone {j + 1} "
+            zone = channel.get(zone_key)
+            if zone is None:
                 print(f"Warning: {zone_key} not found in {channel_key} for preset {preset_num}. Skipping.")
                 continue
-            preset_data[preset_key][channel_key][zone_key]["Sample"] = zones_samples[j]
+            zone.sample = zones_samples[j]
+    return preset
+
+
+def order_zones(preset_banks, feature_store):
+    """Sort each bank by ZONE_ORDER_FEATURE (banks are returned as they are without a feature store)."""
+    if feature_store is None:
+        return preset_banks
+    return [order_by_feature(bank, feature_store, ZONE_ORDER_FEATURE, ZONE_ORDER_DESCENDING) for bank in preset_banks]
+
+
+def prepare(samples_dir=SAMPLES_DIR, template_file=TEMPLATE_FILE, rng=None):
+    """
+    Bring the sample caches up to date and set up a run.
+
+    Returns:
+        (Preset, BankAssigner, FeatureStore): The template, an assigner over
+        the library and the feature store (None unless ZONE_ORDER_FEATURE is set).
+    """
+    # Fingerprint new or changed samples so near-duplicates can be kept apart
+    conflicts = None
+    if REJECT_NEAR_DUPLICATES:
+        fingerprints = FingerprintStore(samples_dir)
+        fingerprints.update()
+        conflicts = fingerprints.index().conflicts
+
+    # Index the directory (only new or changed files have their headers read)
+    with SampleIndex(samples_dir) as sample_index:
+        sample_index.refresh()
+        assigner = make_assigner(sample_index, conflicts, rng)
+
+    feature_store = None
+    if ZONE_ORDER_FEATURE:
+        feature_store = FeatureStore(samples_dir)
+        feature_store.update()
+
+    # Load the template
+    template_key, preset_template = load_template(template_file)
+    return preset_template, assigner, feature_store
+
+
+def main():
+    # Ensure output directory exists
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    rng = random.Random(SEED) if SEED is not None else None
+    preset_template, assigner, feature_store = prepare(SAMPLES_DIR, TEMPLATE_FILE, rng)
+
+    # Generate presets
+    for preset_num in range(1, NUM_PRESETS + 1):
+        # Draw 8 banks of 8 samples (one bank per channel)
+        preset_banks = order_zones(assigner.assign_preset(), feature_store)
+        preset = build_preset(preset_num, preset_template, preset_banks)
+
+        # Save with prstXXX.yml naming convention
+        output_file = os.path.join(OUTPUT_DIR, f"prst{preset_num:03d}.yml")
+        preset.save(output_file)
+
+        print(f"Preset {preset_num} saved to {output_file}")
 
-    # Save with prstXXX.yml naming convention
-    output_file = os.path.join(OUTPUT_DIR, f"prst{preset_num:03d}.yml")
-    with open(output_file, "w") as f:
-        yaml.dump(preset_data, f, Dumper=NoQuotesDumper, default_flow_style=False, sort_keys=False)
+    print("Preset generation complete!")
 
-    print(f"Preset {preset_num} saved to {output_file}")
 
-print("Preset generation complete!")
\ No newline at end of file
+if __name__ == "__main__":
+    with metrics.session("presetgen"):
+        main()
@@ -0,0 +1,153 @@
+import io
+import sys
+import time
+
+import metrics
+
+INDENT = "  "
+
+
+class PresetFormatError(ValueError):
+    """Raised when a preset file does not follow the prstXXX.yml layout."""
+
+
+def _render(mapping, depth, out):
+    indent = INDENT * depth
+    for key, value in mapping.items():
+        if isinstance(value, dict):
+            out.append(f"{indent}{key}:\n")
+            _render(value, depth + 1, out)
+        elif value is None:
+            out.append(f"{indent}{key}:\n")
+        else:
+            text = str(value)
+            if "\n" in text:
+                raise PresetFormatError(f"Value for {key!r} spans several lines: {text!r}")
+            out.append(f"{indent}{key}: {text}\n")
+
+
+@metrics.timed("preset_dump_seconds")
+def dumps_preset(preset_data):
+    """
+    Render a preset dict in the Assimil8or prstXXX.yml layout.
+
+    Keys are written verbatim (so "Zone 1 " becomes "Zone 1 :") and values are
+    never quoted or reinterpreted ("+4.52" stays "+4.52"), matching prst001.yml.
+    """
+    out = []
+    _render(preset_data, 0, out)
+    return "".join(out)
+
+
+def dump_preset(preset_data, stream):
+    """Write a preset dict to an open text stream (see dumps_preset)."""
+    stream.write(dumps_preset(preset_data))
+
+
+@metrics.timed("preset_save_seconds")
+def save_preset(preset_data, path):
+    with open(path, "w", buffering=64 * 1024) as f:
+        dump_preset(preset_data, f)
+
+
+def _parse_value(text):
+    # Plain integers (PlayMode, Side, ...) become ints; everything else stays a
+    # string so voltages like "+4.52" and "5.00" survive a round trip unchanged.
+    if text.isdigit() and str(int(text)) == text:
+        return int(text)
+    return text
+
+
+def loads_preset(text):
+    """
+    Parse prstXXX.yml text into nested dicts, keeping keys exactly as written
+    (including their trailing space) so that dumps_preset(loads_preset(text)) == text.
+    """
+    root = {}
+    stack = [(-1, root)]  # (indent, mapping)
+    pending = None  # (indent, parent, key) of the last "key:" line without a value
+    for line_number, line in enumerate(text.splitlines(), 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if "\t" in line[:len(line) - len(line.lstrip())]:
+            raise PresetFormatError(f"line {line_number}: tab in indentation")
+        indent = len(line) - len(line.lstrip(" "))
+        key, sep, rest = line[indent:].partition(":")
+        if not sep:
+            raise PresetFormatError(f"line {line_number}: expected 'key : value', got {line!r}")
+
+        if pending is not None:
+            pending_indent, parent, pending_key = pending
+            if indent > pending_indent:
+                child = {}
+                parent[pending_key] = child
+                stack.append((pending_indent, child))
+            pending = None
+        while indent <= stack[-1][0]:
+            stack.pop()
+        mapping = stack[-1][1]
+
+        value = rest[1:] if rest.startswith(" ") else rest
+        if value.strip():
+            mapping[key] = _parse_value(value.rstrip("\r"))
+        else:
+            mapping[key] = None
+            pending = (indent, mapping, key)
+    return root
+
+
+def load_preset(stream):
+    """Parse a preset from an open text stream (see loads_preset)."""
+    return loads_preset(stream.read())
+
+
+def read_preset(path):
+    with open(path, "r") as f:
+        return load_preset(f)
+
+
+def yaml_dump_preset(preset_data, stream):
+    """The PyYAML path the scripts used before this module, kept for benchmarks."""
+    import yaml
+
+    # Custom YAML dumper to remove quotes
+    class NoQuotesDumper(yaml.SafeDumper):
+        def represent_str(self, data):
+            return self.represent_scalar('tag:yaml.org,2002:str', data, style='')
+
+    NoQuotesDumper.add_representer(str, NoQuotesDumper.represent_str)
+    yaml.dump(preset_data, stream, Dumper=NoQuotesDumper, default_flow_style=False, sort_keys=False)
+
+
+def benchmark(path, repeat=200):
+    """
+    Compare this module against the PyYAML path the scripts used
+    (NoQuotesDumper / safe_load) on `path`. Returns seconds per preset.
+    """
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+    with open(path, "r") as f:
+        text = f.read()
+    preset = loads_preset(text)
+
+    def timed(func):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) / repeat
+
+    return {
+        "yaml.dump (NoQuotesDumper)": timed(lambda: yaml_dump_preset(preset, io.StringIO())),
+        "presetio.dump_preset": timed(lambda: dump_preset(preset, io.StringIO())),
+        f"yaml.load ({loader.__name__})": timed(lambda: yaml.load(text, Loader=loader)),
+        "presetio.loads_preset": timed(lambda: loads_preset(text)),
+        "round trip identical": dumps_preset(preset) == text,
+    }
+
+
+if __name__ == "__main__":
+    for name, result in benchmark(sys.argv[1] if len(sys.argv) > 1 else "prst001.yml").items():
+        print(f"{name:32s} {result * 1e3:.3f} ms" if not isinstance(result, bool) else f"{name:32s} {result}")
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+INDEX_FILE = "index.json"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB of cached API responses
+CHUNK_SIZE = 64 * 1024
+
+
+def cache_key(prompt, duration_seconds, settings=None):
+    """
+    Content address of a generated sound effect: a SHA-256 over the prompt,
+    the duration and any extra request settings (model, prompt influence, ...).
+    """
+    material = json.dumps(
+        {"prompt": prompt, "duration": float(duration_seconds), "settings": settings or {}},
+        sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class SoundCache:
+    """
+    Persistent on-disk cache of raw API responses, keyed by cache_key().
+
+    Blobs live in two-level fan-out directories under `cache_dir`; an index file
+    records size, last use and the request that produced each entry. When the
+    total size exceeds `max_bytes`, least recently used entries are evicted.
+
+    Args:
+        cache_dir (str): Directory holding the blobs and the index.
+        max_bytes (int): Size bound for all cached blobs.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, INDEX_FILE)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = self._load_index()
+        self.total_bytes = sum(entry["size"] for entry in self.entries.values())
+
+    key = staticmethod(cache_key)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                entries = json.load(f).get("entries", {})
+        except FileNotFoundError:
+            return {}
+        except (ValueError, AttributeError):
+            print(f"Warning: cache index {self.index_path} is corrupt. Starting empty.")
+            return {}
+        # Drop entries whose blob went missing
+        return {key: entry for key, entry in entries.items() if os.path.exists(self.blob_path(key))}
+
+    def blob_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def lookup(self, key):
+        """Return the blob path for `key` (marking it recently used), or None."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or not os.path.exists(self.blob_path(key)):
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            entry["last_used"] = time.time()
+            self.hits += 1
+            return self.blob_path(key)
+
+    def iter_chunks(self, path, chunk_size=CHUNK_SIZE):
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    @contextmanager
+    def writer(self, key, **meta):
+        """
+        Context manager yielding a binary file for a new entry. The blob is only
+        published (atomically renamed into place) if the block exits cleanly.
+        """
+        path = self.blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with open(tmp_path, "wb") as f:
+                yield f
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._add(key, os.path.getsize(path), meta)
+
+    def put(self, key, data, **meta):
+        with self.writer(key, **meta) as f:
+            f.write(data)
+        return self.blob_path(key)
+
+    def _add(self, key, size, meta):
+        with self._lock:
+            old = self.entries.get(key)
+            if old is not None:
+                self.total_bytes -= old["size"]
+            now = time.time()
+            self.entries[key] = dict(meta, size=size, created=now, last_used=now)
+            self.total_bytes += size
+            self._evict(keep=key)
+            self._save_locked()
+
+    def _evict(self, keep=None):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            entry = self.entries.pop(key)
+            self.total_bytes -= entry["size"]
+            self.evictions += 1
+            try:
+                os.remove(self.blob_path(key))
+            except FileNotFoundError:
+                pass
+
+    def _save_locked(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": 1, "entries": self.entries}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def save(self):
+        """Persist the index (including last-use times updated by lookups)."""
+        with self._lock:
+            self._save_locked()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+            }
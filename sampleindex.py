@@ -0,0 +1,129 @@
+import os
+import sqlite3
+
+from audioio import WavFormatError, read_wav_info
+
+INDEX_FILE = ".sampleindex.sqlite"  # default index location inside the samples directory
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    frames INTEGER,
+    sample_rate INTEGER,
+    channels INTEGER,
+    bits INTEGER
+);
+CREATE INDEX IF NOT EXISTS samples_frames ON samples(frames);
+"""
+
+
+class SampleIndex:
+    """
+    Persistent SQLite index of WAV metadata for one samples directory.
+
+    refresh() walks the directory once and only reads the headers of files whose
+    size or mtime changed since the last run, so startup cost tracks the number
+    of changed files rather than the size of the library. Unreadable files are
+    kept with NULL metadata so they are not re-read every run either.
+
+    Args:
+        samples_dir (str): Directory containing the .wav samples.
+        db_path (str): SQLite file (defaults to INDEX_FILE inside samples_dir).
+    """
+
+    def __init__(self, samples_dir, db_path=None):
+        self.samples_dir = samples_dir
+        self.db_path = db_path or os.path.join(samples_dir, INDEX_FILE)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _scan(self):
+        with os.scandir(self.samples_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".wav") and entry.is_file():
+                    st = entry.stat()
+                    yield entry.name, st.st_size, st.st_mtime_ns
+
+    def read_row(self, name, size, mtime_ns):
+        path = os.path.join(self.samples_dir, name)
+        try:
+            info = read_wav_info(path)
+        except (WavFormatError, OSError):
+            print(f"Error reading {name}. Skipping.")
+            return (name, size, mtime_ns, None, None, None, None)
+        return (name, size, mtime_ns, info.frames, info.sample_rate, info.channels, info.bits)
+
+    def refresh(self):
+        """
+        Bring the index in line with the directory.
+
+        Returns:
+            dict: Counts of added, updated, removed and unchanged files.
+        """
+        known = {path: (size, mtime_ns) for path, size, mtime_ns
+                 in self.conn.execute("SELECT path, size, mtime_ns FROM samples")}
+        counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        rows = []
+        for name, size, mtime_ns in self._scan():
+            previous = known.pop(name, None)
+            if previous == (size, mtime_ns):
+                counts["unchanged"] += 1
+                continue
+            counts["updated" if previous else "added"] += 1
+            rows.append(self.read_row(name, size, mtime_ns))
+
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.executemany("DELETE FROM samples WHERE path = ?", ((name,) for name in known))
+        counts["removed"] = len(known)
+        return counts
+
+    def update(self, name):
+        """Index (or re-index) a single file; returns its metadata dict."""
+        st = os.stat(os.path.join(self.samples_dir, name))
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              self.read_row(name, st.st_size, st.st_mtime_ns))
+        return self.info(name)
+
+    def remove(self, name):
+        with self.conn:
+            self.conn.execute("DELETE FROM samples WHERE path = ?", (name,))
+
+    def all_samples(self):
+        return [path for path, in self.conn.execute("SELECT path FROM samples ORDER BY path")]
+
+    def info(self, name):
+        """Metadata row for one sample as a dict, or None if it is not indexed."""
+        cursor = self.conn.execute("SELECT * FROM samples WHERE path = ?", (name,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+    def length_groups(self, min_size=1):
+        """
+        Samples grouped by frame count, keeping only groups with at least
+        `min_size` members. Returns {frames: [sample, ...]} in frame order.
+        """
+        groups = {}
+        query = """
+            SELECT frames, path FROM samples
+            WHERE frames IN (SELECT frames FROM samples WHERE frames IS NOT NULL
+                             GROUP BY frames HAVING COUNT(*) >= ?)
+            ORDER BY frames, path
+        """
+        for frames, path in self.conn.execute(query, (min_size,)):
+            groups.setdefault(frames, []).append(path)
+        return groups
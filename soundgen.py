@@ -0,0 +1,280 @@
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Engine defaults (override per SoundGenerator)
+MAX_IN_FLIGHT = 4  # concurrent API requests
+REQUESTS_PER_SECOND = 2.0  # sustained request rate
+BURST = 4  # requests allowed back to back before the rate limit kicks in
+MAX_RETRIES = 5  # retries per job on 429/5xx
+BACKOFF_BASE = 1.0  # seconds, doubled per attempt before jitter
+BACKOFF_MAX = 30.0  # seconds, upper bound for a single backoff
+
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+# One unit of work: a prompt rendered for a duration into one output file
+GenerationJob = namedtuple("GenerationJob", ["prompt", "duration", "output_wav"])
+
+
+class GenerationError(Exception):
+    """Raised after a run when one or more jobs failed permanently."""
+
+    def __init__(self, failures):
+        self.failures = failures  # list of (job, exception)
+        names = ", ".join(job.output_wav for job, _ in failures[:5])
+        more = f" (+{len(failures) - 5} more)" if len(failures) > 5 else ""
+        super().__init__(f"{len(failures)} generation job(s) failed: {names}{more}")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Each acquire() takes one token and blocks until
+    one is available, so the long-run rate never exceeds `rate` per second.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    if waited:
+                        metrics.observe("rate_limit_wait_seconds", waited)
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+
+def status_code_of(exc):
+    """Best-effort HTTP status code of an API exception (None if unknown)."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(exc):
+    return status_code_of(exc) in RETRY_STATUS or isinstance(exc, (ConnectionError, TimeoutError))
+
+
+class SoundGenerator:
+    """
+    Runs text-to-sound-effect jobs against an ElevenLabs-style client with a
+    bounded number of requests in flight, token-bucket rate limiting and
+    jittered exponential backoff on 429/5xx responses.
+
+    Args:
+        client: Object exposing `text_to_sound_effects.convert(text=..., duration_seconds=...)`
+            that returns an iterable of audio byte chunks (the real client or FakeSoundClient).
+        max_in_flight (int): Maximum number of concurrent requests.
+        requests_per_second (float): Sustained request rate across all workers.
+        burst (int): Token bucket capacity.
+        max_retries (int): Retries per job for retryable errors.
+        cache: Optional samplecache.SoundCache; hits skip the API entirely and
+            fresh responses are written through to it.
+        settings (dict): Extra keyword arguments sent with every request. They are
+            part of the cache key.
+        seed: Seed for the backoff jitter (None for non-deterministic).
+    """
+
+    def __init__(self, client, max_in_flight=MAX_IN_FLIGHT, requests_per_second=REQUESTS_PER_SECOND,
+                 burst=BURST, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, cache=None, settings=None, seed=None, sleep=time.sleep):
+        self.client = client
+        self.cache = cache
+        self.settings = dict(settings or {})
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(requests_per_second, max(1, burst), sleep=sleep)
+        self._sleep = sleep
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._key_locks = {}
+
+    def backoff_delay(self, attempt):
+        # "Full jitter": uniform in [0, min(cap, base * 2^attempt)]
+        with self._rng_lock:
+            return self._rng.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def convert(self, job):
+        """Issue one rate-limited API request and return its chunk iterator."""
+        self.bucket.acquire()
+        metrics.inc("api_requests")
+        start = time.perf_counter()
+        chunks = self.client.text_to_sound_effects.convert(
+            text=job.prompt,
+            duration_seconds=job.duration,
+            **self.settings
+        )
+        return _timed_stream(chunks, start)
+
+    def process(self, job, handle):
+        """
+        Run a single job with retries. `handle(job, chunks)` consumes the audio
+        stream and is re-invoked from scratch on every attempt, because errors can
+        surface while the response is still streaming.
+        """
+        if self.cache is None:
+            return self._process_uncached(job, handle, None)
+
+        # Serialize jobs that share a key so a duplicate waits for the first response instead of paying again
+        key = self.cache.key(job.prompt, job.duration, self.settings)
+        with self._rng_lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            cached = self.cache.lookup(key)
+            if cached is not None:
+                metrics.inc("cache_hits")
+                return handle(job, self.cache.iter_chunks(cached))
+            metrics.inc("cache_misses")
+            return self._process_uncached(job, handle, key)
+
+    def _process_uncached(self, job, handle, key):
+        attempt = 0
+        while True:
+            try:
+                if key is None:
+                    return handle(job, self.convert(job))
+                with self.cache.writer(key, prompt=job.prompt, duration=job.duration) as f:
+                    return handle(job, _tee(self.convert(job), f))
+            except Exception as e:
+                metrics.inc("api_errors")
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                metrics.inc("api_retries")
+                delay = self.backoff_delay(attempt)
+                attempt += 1
+                print(f"Retrying {job.prompt!r} in {delay:.1f}s "
+                      f"(attempt {attempt}/{self.max_retries}, status {status_code_of(e)})")
+                self._sleep(delay)
+
+    def run(self, jobs, handle):
+        """
+        Process all jobs concurrently and return their results in job order.
+
+        Every job is attempted even if others fail; permanent failures are then
+        raised together as a GenerationError.
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        results = [None] * len(jobs)
+        failures = []
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(jobs))) as pool:
+            futures = [pool.submit(self.process, job, handle) for job in jobs]
+            for i, future in enumerate(futures):
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    print(f"Failed: {jobs[i].prompt} -> {jobs[i].output_wav}: {e}")
+                    failures.append((jobs[i], e))
+        if failures:
+            raise GenerationError(failures)
+        return results
+
+
+def _timed_stream(chunks, start):
+    # The response streams lazily, so the request's latency is only known once it is consumed
+    first = True
+    size = 0
+    for chunk in chunks:
+        if first:
+            metrics.observe("api_first_chunk_seconds", time.perf_counter() - start)
+            first = False
+        size += len(chunk)
+        yield chunk
+    metrics.observe("api_convert_seconds", time.perf_counter() - start)
+    metrics.inc("api_bytes", size)
+
+
+def _tee(chunks, f):
+    for chunk in chunks:
+        f.write(chunk)
+        yield chunk
+
+
+class FakeApiError(Exception):
+    """Stand-in for the client's API error, carrying an HTTP status code."""
+
+    def __init__(self, status_code, message="fake API error"):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+
+class _FakeSoundEffects:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def convert(self, text, duration_seconds, **kwargs):
+        return self._owner._convert(text, duration_seconds, **kwargs)
+
+
+class FakeSoundClient:
+    """
+    Local stand-in for the ElevenLabs client, for tests and benchmarks.
+
+    Args:
+        latency (float): Seconds each request takes before the first chunk.
+        jitter (float): Extra random latency, uniform in [0, jitter].
+        failure_rate (float): Probability that a request fails with `failure_status`.
+        failure_status (int): HTTP status used for injected failures.
+        payload: Bytes to return, or a callable (text, duration) -> bytes.
+        chunk_size (int): Size of the chunks the response is split into.
+        seed: Seed for latency jitter and failure injection.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, failure_status=429,
+                 payload=b"\x00" * 4096, chunk_size=1024, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.payload = payload
+        self.chunk_size = chunk_size
+        self.text_to_sound_effects = _FakeSoundEffects(self)
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight_seen = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _convert(self, text, duration_seconds, **kwargs):
+        with self._lock:
+            self.calls.append((text, duration_seconds, kwargs))
+            fail = self._rng.random() < self.failure_rate
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+        return self._stream(text, duration_seconds, delay, fail)
+
+    def _stream(self, text, duration_seconds, delay, fail):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight_seen = max(self.max_in_flight_seen, self.in_flight)
+        try:
+            time.sleep(delay)
+            if fail:
+                raise FakeApiError(self.failure_status)
+            data = self.payload(text, duration_seconds) if callable(self.payload) else self.payload
+            for i in range(0, len(data), self.chunk_size):
+                yield data[i:i + self.chunk_size]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
@@ -1,26 +1,130 @@
 import os
-from pydub import AudioSegment
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import metrics
+from pcm import block_mean_square, copy_frames, open_pcm
 
 # Directories
 INPUT_DIR = "/Users/mikesidnam/Desktop/Keepers/NormalizedKeepers"
 OUTPUT_DIR = "/Users/mikesidnam/Desktop/EditedKeepers"
 
-# Ensure output directory exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
 # Parameters for silence detection
 SILENCE_THRESHOLD = -35  # dBFS (anything below this is considered silence)
 MIN_SILENCE_LEN = 100  # milliseconds (minimum length of silence to detect)
+TRIM_TRAILING = True  # also strip silence from the end of each file
+SCAN_BLOCKS = 256  # blocks measured per vectorized step
+
+
+def _first_loud_block(samples, info, block_frames, threshold_sq, from_end):
+    """
+    Offset (in frames) of the silence boundary, scanning SCAN_BLOCKS blocks at a
+    time from the start (or end) so only the silent edge of the file is read.
+    """
+    frames = len(samples)
+    window = SCAN_BLOCKS * block_frames
+    pos = frames if from_end else 0
+    while (pos > 0) if from_end else (pos < frames):
+        if from_end:
+            segment = samples[max(0, pos - window):pos][::-1]
+        else:
+            segment = samples[pos:min(frames, pos + window)]
+        loud = np.flatnonzero(block_mean_square(segment, info, block_frames) >= threshold_sq)
+        if loud.size:
+            offset = int(loud[0]) * block_frames
+            return pos - offset if from_end else pos + offset
+        pos = pos - len(segment) if from_end else pos + len(segment)
+    return pos
+
+
+@metrics.timed("silence_detect_seconds")
+def find_silence_bounds(info, samples, silence_threshold=SILENCE_THRESHOLD, chunk_size=MIN_SILENCE_LEN,
+                        leading=True, trailing=TRIM_TRAILING):
+    """
+    First and one-past-last frame to keep of already opened PCM data (see pcm.open_pcm).
+
+    Works like pydub's detect_leading_silence (chunk_size ms blocks whose RMS over
+    all channels is below silence_threshold dBFS count as silence) but measures
+    blocks with NumPy.
+    """
+    block_frames = max(1, info.sample_rate * chunk_size // 1000)
+    threshold_sq = (10 ** (silence_threshold / 20.0)) ** 2
+    start, end = 0, info.frames
+    if leading and info.frames:
+        start = _first_loud_block(samples, info, block_frames, threshold_sq, from_end=False)
+    if trailing and start < end:
+        end = _first_loud_block(samples, info, block_frames, threshold_sq, from_end=True)
+    return start, max(start, end)
+
+
+def detect_silence(input_path, silence_threshold=SILENCE_THRESHOLD, chunk_size=MIN_SILENCE_LEN,
+                   leading=True, trailing=TRIM_TRAILING):
+    """
+    Find the non-silent region of a WAV file via its memory-mapped PCM data.
+
+    Returns:
+        (WavInfo, int, int): Header plus the first and one-past-last frame to keep.
+    """
+    info, samples = open_pcm(input_path)
+    start, end = find_silence_bounds(info, samples, silence_threshold, chunk_size, leading, trailing)
+    return info, start, end
+
+
+def strip_silence(input_path, output_path, leading=True, trailing=TRIM_TRAILING):
+    """
+    Write `input_path` to `output_path` without its leading (and trailing)
+    silence. The kept region is copied byte for byte; nothing is re-encoded.
+
+    Returns:
+        (float, float): Milliseconds removed from the start and from the end.
+    """
+    info, start, end = detect_silence(input_path, leading=leading, trailing=trailing)
+    copy_frames(input_path, info, output_path, start, end)
+    return start * 1000.0 / info.sample_rate, (info.frames - end) * 1000.0 / info.sample_rate
 
 
 def strip_leading_silence(input_path, output_path):
-    # Load the WAV file
-    audio = AudioSegment.from_wav(input_path)
+    return strip_silence(input_path, output_path, leading=True, trailing=False)[0]
+
+
+def _strip_one(args):
+    filename, input_dir, output_dir = args
+    try:
+        lead_ms, tail_ms = strip_silence(os.path.join(input_dir, filename), os.path.join(output_dir, filename))
+        return filename, lead_ms, tail_ms, None
+    except Exception as e:
+        return filename, 0.0, 0.0, e
+
+
+def strip_directory(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR, workers=None, filenames=None):
+    """
+    Strip silence from every WAV in `input_dir` (or just `filenames`) across a process pool.
+
+    Returns:
+        dict: Counts of processed and failed files, failed file names and elapsed seconds.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if filenames is None:
+        filenames = sorted(f for f in os.listdir(input_dir) if f.lower().endswith(".wav"))
+    summary = {"processed": 0, "failed": 0, "failed_files": [], "elapsed": 0.0}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        tasks = ((filename, input_dir, output_dir) for filename in filenames)
+        for filename, lead_ms, tail_ms, error in metrics.map_collected(pool, _strip_one, tasks, chunksize=16):
+            if error is not None:
+                print(f"Error processing {filename}: {error}")
+                summary["failed"] += 1
+                summary["failed_files"].append(filename)
+            else:
+                print(f"Processed: {filename} (trimmed {lead_ms:.0f} ms leading, {tail_ms:.0f} ms trailing)")
+                summary["processed"] += 1
+    summary["elapsed"] = time.perf_counter() - start
+    print(f"Processed {summary['processed']} files, {summary['failed']} failed in {summary['elapsed']:.1f}s")
+    return summary
 
-    # Detect leading silence
-    silence_end = audio.detect_leading_silence(
-        silence_threshold=SILENCE_THRESHOLD,
-        chunk_size=MIN_SILENCE_LEN
-    )
 
-    # If no silence detected, silence_end is 0; otherwise
\ No newline at end of file
+if __name__ == "__main__":
+    with metrics.session("stripSilence"):
+        strip_directory(INPUT_DIR, OUTPUT_DIR)
@@ -0,0 +1,194 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from presetgen import SAMPLES_DIR, TEMPLATE_FILE, build_preset, order_zones, prepare
+
+# Directories
+OUTPUT_DIR = "/Users/mikesidnam/Desktop/PresetVariants"  # one subdirectory per card
+
+NUM_PRESETS = 199 * 100
+RUN_SEED = None  # None picks a fresh one (printed and recorded in the manifest)
+PRESETS_PER_CARD = 199  # Assimil8or preset slots prst001-prst199
+SHARD_SIZE = 256  # presets per pool task, written out together
+MANIFEST_FILE = "manifest.jsonl"  # run header, then one line per preset
+
+# Per-worker run state, set by _init_worker
+_template = None
+_assigner = None
+_feature_store = None
+
+
+def preset_seed(run_seed, index):
+    """The seed preset `index` (0-based, across all cards) draws its samples with."""
+    digest = hashlib.blake2b(f"{run_seed}:{index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def preset_location(index, per_card=PRESETS_PER_CARD):
+    """(card directory name, preset number on that card) of preset `index`."""
+    card, slot = divmod(index, per_card)
+    return f"card{card + 1:04d}", slot + 1
+
+
+def draw_preset(assigner, seed, feature_store=None):
+    """
+    Draw the banks for one preset from `assigner`'s pools with `seed` (the
+    assigner itself is left as it is; see BankAssigner.sample_preset()).
+
+    Every preset draws from the same assigner state, so its banks depend only
+    on the library and its seed. Constraints that span presets
+    (UNIQUE_ACROSS_PRESETS above 1, MAX_SAMPLE_REUSE) therefore do not apply
+    between them.
+
+    Returns:
+        (list, int): The banks and how many of them were drawn with relaxed constraints.
+    """
+    banks, relaxed = assigner.sample_preset(random.Random(seed))
+    return order_zones(banks, feature_store), relaxed
+
+
+def _init_worker(template, assigner, feature_store):
+    global _template, _assigner, _feature_store
+    _template, _assigner, _feature_store = template, assigner, feature_store
+
+
+def _generate_shard(args):
+    run_seed, start, stop, output_dir, per_card = args
+    try:
+        records = []
+        presets = []
+        for index in range(start, stop):
+            seed = preset_seed(run_seed, index)
+            banks, relaxed = draw_preset(_assigner, seed, _feature_store)
+            card, number = preset_location(index, per_card)
+            preset = build_preset(number, _template, banks)
+            path = os.path.join(card, f"prst{number:03d}.yml")
+            presets.append((path, preset.dumps()))
+            records.append({"index": index, "file": path, "seed": seed, "relaxed": relaxed, "banks": banks})
+        # Write the shard's files in one go once they are all rendered
+        for path, text in presets:
+            full_path = os.path.join(output_dir, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "w", buffering=64 * 1024) as f:
+                f.write(text)
+        return start, records, None
+    except Exception as e:
+        return start, None, e
+
+
+def generate_variants(num_presets=NUM_PRESETS, run_seed=RUN_SEED, output_dir=OUTPUT_DIR, samples_dir=SAMPLES_DIR,
+                      template_file=TEMPLATE_FILE, per_card=PRESETS_PER_CARD, shard_size=SHARD_SIZE, workers=None):
+    """
+    Generate `num_presets` presets across a process pool, PRESETS_PER_CARD per
+    card directory, and record each preset's seed and banks in the manifest.
+
+    Any single preset can later be rebuilt with regenerate(run_seed, index).
+
+    Returns:
+        dict: The run seed, counts of written presets, presets drawn with
+        relaxed constraints and failed shards, and elapsed seconds.
+    """
+    if run_seed is None:
+        run_seed = random.SystemRandom().randrange(1 << 63)
+    print(f"Run seed: {run_seed}")
+    os.makedirs(output_dir, exist_ok=True)
+    template, assigner, feature_store = prepare(samples_dir, template_file)
+    summary = {"run_seed": run_seed, "written": 0, "relaxed": 0, "failed_shards": 0, "elapsed": 0.0}
+    start = time.perf_counter()
+
+    shards = [(run_seed, first, min(first + shard_size, num_presets), output_dir, per_card)
+              for first in range(0, num_presets, shard_size)]
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(manifest_path, "w") as manifest:
+        header = {"run_seed": run_seed, "num_presets": num_presets, "per_card": per_card,
+                  "samples_dir": os.path.abspath(samples_dir), "template": os.path.abspath(template_file),
+                  "samples": assigner.total_samples, "created": time.time()}
+        manifest.write(json.dumps(header) + "\n")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(template, assigner, feature_store)) as pool:
+            for first, records, error in metrics.map_collected(pool, _generate_shard, shards):
+                if error is not None:
+                    print(f"Error generating presets {first}-{min(first + shard_size, num_presets) - 1}: {error}")
+                    summary["failed_shards"] += 1
+                    continue
+                manifest.writelines(json.dumps(record) + "\n" for record in records)
+                manifest.flush()
+                summary["written"] += len(records)
+                summary["relaxed"] += sum(1 for record in records if record["relaxed"])
+                metrics.inc("variant_presets", len(records))
+                print(f"Wrote presets {first}-{first + len(records) - 1} "
+                      f"({summary['written']}/{num_presets})")
+
+    summary["elapsed"] = time.perf_counter() - start
+    if summary["relaxed"]:
+        print(f"Warning: {summary['relaxed']} presets had too few unique samples for the constraints "
+              f"and contain duplicates (see 'relaxed' in the manifest).")
+    print(f"Generated {summary['written']} presets on {-(-summary['written'] // per_card)} cards "
+          f"in {summary['elapsed']:.1f}s (seed {run_seed})")
+    return summary
+
+
+def regenerate(run_seed, index, output_dir=None, samples_dir=SAMPLES_DIR, template_file=TEMPLATE_FILE,
+               per_card=PRESETS_PER_CARD, setup=None):
+    """
+    Rebuild preset `index` of the run seeded with `run_seed`, exactly as
+    generate_variants() wrote it (given the same library and template).
+
+    Args:
+        output_dir (str): Also write it back to its place under this directory.
+        setup: (template, assigner, feature_store) from presetgen.prepare(), to
+            skip setting up again when regenerating several presets.
+
+    Returns:
+        (Preset, dict): The preset and its manifest record.
+    """
+    template, assigner, feature_store = setup or prepare(samples_dir, template_file)
+    seed = preset_seed(run_seed, index)
+    banks, relaxed = draw_preset(assigner, seed, feature_store)
+    card, number = preset_location(index, per_card)
+    preset = build_preset(number, template, banks)
+    path = os.path.join(card, f"prst{number:03d}.yml")
+    if output_dir is not None:
+        os.makedirs(os.path.join(output_dir, card), exist_ok=True)
+        preset.save(os.path.join(output_dir, path))
+    return preset, {"index": index, "file": path, "seed": seed, "relaxed": relaxed, "banks": banks}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate large, reproducible sets of preset variants in parallel.")
+    parser.add_argument("--num-presets", type=int, default=NUM_PRESETS)
+    parser.add_argument("--seed", type=int, default=RUN_SEED, help="run seed (default: a fresh one)")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--samples-dir", default=SAMPLES_DIR)
+    parser.add_argument("--template", default=TEMPLATE_FILE)
+    parser.add_argument("--per-card", type=int, default=PRESETS_PER_CARD)
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--regenerate", type=int, nargs="+", metavar="INDEX",
+                        help="only rebuild these presets (0-based) of the run given by --seed")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.regenerate is None:
+        return generate_variants(args.num_presets, args.seed, args.output_dir, args.samples_dir, args.template,
+                                 args.per_card, args.shard_size, args.workers)
+    if args.seed is None:
+        raise SystemExit("--regenerate needs the run's --seed (see the manifest header)")
+    setup = prepare(args.samples_dir, args.template)
+    for index in args.regenerate:
+        _, record = regenerate(args.seed, index, args.output_dir, args.samples_dir, args.template, args.per_card,
+                               setup)
+        print(f"Regenerated preset {index} to {os.path.join(args.output_dir, record['file'])}")
+
+
+if __name__ == "__main__":
+    with metrics.session("variants"):
+        main()
@@ -0,0 +1,390 @@
+import argparse
+import json
+import os
+import random
+import time
+
+import metrics
+import mp3towavscript
+import presetgen
+import stripSilence
+from audioio import atomic_output
+from features import FeatureStore
+from fingerprint import FingerprintStore
+from presetgen import build_preset, load_template, make_assigner, order_zones
+from sampleindex import SampleIndex
+
+# Directories
+MP3_DIR = "/Users/mikesidnam/Desktop/morphagene"  # MP3 drop folder (the one mp3towavscript.py targets)
+CONVERTED_DIR = MP3_DIR  # where the converted WAVs go
+SAMPLES_DIR = presetgen.SAMPLES_DIR  # WAV drop folder: trimmed, indexed and drawn into presets
+TRIMMED_DIR = stripSilence.OUTPUT_DIR  # silence-stripped copies of the samples
+PRESETS_DIR = presetgen.OUTPUT_DIR
+TEMPLATE_FILE = presetgen.TEMPLATE_FILE
+NUM_PRESETS = presetgen.NUM_PRESETS
+
+POLL_INTERVAL = 2.0  # seconds between directory scans
+DEBOUNCE_SECONDS = 5.0  # process a burst of changes once nothing has changed for this long
+MAX_DELAY_SECONDS = 60.0  # ...or once changes have been pending this long, even if files keep changing
+RETRY_SECONDS = 300.0  # failed conversions are retried this often (or as soon as the MP3 changes)
+CONVERT_CHECK = "size"  # how changed MP3s are checked against their WAVs (see mp3towavscript.is_up_to_date)
+STATE_FILE = ".watch.json"  # inside the presets directory: what was processed and what each preset holds
+
+
+def scan(directory, suffix):
+    """{name: [size, mtime_ns]} of the files in `directory` ending in `suffix` (hidden files skipped)."""
+    files = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.name.lower().endswith(suffix) or not entry.is_file():
+                    continue
+                st = entry.stat()
+                files[entry.name] = [st.st_size, st.st_mtime_ns]
+    except FileNotFoundError:
+        pass
+    return files
+
+
+def diff(old, new):
+    """(names added or modified, names removed) between two scans."""
+    changed = sorted(name for name, stat in new.items() if old.get(name) != stat)
+    removed = sorted(name for name in old if name not in new)
+    return changed, removed
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+class Watcher:
+    """
+    Polls the MP3 and sample folders and, once a burst of changes has settled,
+    takes only the new, changed or removed files through conversion, trimming
+    and indexing, then rewrites only the presets they affect.
+
+    A preset is affected when it holds a sample that changed or disappeared,
+    when one of its channels draws from a same-length group that gained
+    samples (so the newcomers get used), when its file is missing, or when
+    the template changed. Without same-length groups all samples form one
+    pool; new samples then wait for the next affected preset rather than
+    rewriting every preset. Removing an MP3 leaves its WAV in place. The bank
+    assigner and the fingerprint and feature stores are kept between batches
+    and updated with the changed files.
+
+    What was processed, and which samples every preset holds, is kept in
+    STATE_FILE, so changes made while the watcher was stopped are picked up
+    when it starts.
+
+    Args:
+        seed: Seed for the sample draws (None = different every run).
+        debounce (float): Quiet seconds that end a burst of changes.
+        max_delay (float): Longest a pending change waits for a burst to end.
+    """
+
+    def __init__(self, mp3_dir=MP3_DIR, converted_dir=CONVERTED_DIR, samples_dir=SAMPLES_DIR,
+                 trimmed_dir=TRIMMED_DIR, presets_dir=PRESETS_DIR, template_file=TEMPLATE_FILE,
+                 num_presets=NUM_PRESETS, seed=None, debounce=DEBOUNCE_SECONDS, max_delay=MAX_DELAY_SECONDS,
+                 clock=time.monotonic):
+        self.mp3_dir = mp3_dir
+        self.converted_dir = converted_dir
+        self.samples_dir = samples_dir
+        self.trimmed_dir = trimmed_dir
+        self.presets_dir = presets_dir
+        self.template_file = template_file
+        self.num_presets = num_presets
+        self.rng = random.Random(seed) if seed is not None else None
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.clock = clock
+        self.state_path = os.path.join(presets_dir, STATE_FILE)
+        self.state = self._load_state()
+        self._template = None
+        self._fingerprints = None  # FingerprintStore while REJECT_NEAR_DUPLICATES is on
+        self._features = None  # FeatureStore while ZONE_ORDER_FEATURE is set
+        self._assigner = None  # built from the index when presets are first drawn, then kept up to date
+        self._frames = {}  # sample name -> frames, for the samples the assigner holds
+        self._lengths = {}  # frames -> number of samples of that length
+        self._last_scan = None
+        self._changed_at = None  # when the scan last differed from the one before
+        self._pending_since = None  # when unprocessed changes were first seen
+        self._failed = {}  # MP3 name -> [size, mtime_ns] when it last failed to convert
+        self._retry_at = None
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        state.setdefault("mp3", {})
+        state.setdefault("samples", {})
+        state.setdefault("template", None)
+        state.setdefault("presets", {})  # preset number -> {"banks": [...], "groups": [...]}
+        return state
+
+    def save_state(self):
+        os.makedirs(self.presets_dir, exist_ok=True)
+        with atomic_output(self.state_path) as tmp_path:
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f)
+
+    def scan(self):
+        return {"mp3": scan(self.mp3_dir, ".mp3"), "samples": scan(self.samples_dir, ".wav"),
+                "template": _stat(self.template_file)}
+
+    def poll(self):
+        """
+        Scan once. Returns True when there are unprocessed changes and they
+        have settled (or have been pending for max_delay seconds).
+        """
+        now = self.clock()
+        current = self.scan()
+        if current != self._last_scan:
+            self._last_scan = current
+            self._changed_at = now
+        if all(current[key] == self.state[key] for key in current) or (
+                self._only_failures(current) and now < self._retry_at):
+            self._pending_since = None
+            return False
+        if self._pending_since is None:
+            self._pending_since = now
+        return now - self._changed_at >= self.debounce or now - self._pending_since >= self.max_delay
+
+    def _only_failures(self, current):
+        # True if the only unprocessed changes are MP3s that failed and have not changed since
+        if not self._failed or any(current[key] != self.state[key] for key in ("samples", "template")):
+            return False
+        mp3, processed = current["mp3"], self.state["mp3"]
+        return (all(name in mp3 for name in processed)
+                and all(self._failed.get(name) == stat for name, stat in mp3.items() if processed.get(name) != stat))
+
+    @metrics.timed("watch_batch_seconds")
+    def process(self):
+        """
+        Bring everything up to date with the folders as they are now.
+
+        Returns:
+            dict: Counts of converted, failed, trimmed, indexed and removed files and of rewritten presets.
+        """
+        start = time.perf_counter()
+        summary = {"converted": 0, "failed": 0, "trimmed": 0, "indexed": 0, "removed": 0, "presets": 0}
+
+        current_mp3 = scan(self.mp3_dir, ".mp3")
+        changed, _ = diff(self.state["mp3"], current_mp3)
+        failed = []
+        if changed:
+            result = mp3towavscript.convert_mp3_to_wav(self.mp3_dir, self.converted_dir, check=CONVERT_CHECK,
+                                                       filenames=changed)
+            summary["converted"] = result["converted"]
+            failed = result["failed_files"]
+            if result["converted"] + result["skipped"] + result["failed"] < len(changed):
+                failed = changed  # it gave up before trying (e.g. no ffmpeg)
+            summary["failed"] = len(failed)
+        # Failed MP3s keep their previous entry, so they still count as changed until they convert
+        mp3_state = dict(current_mp3)
+        for name in failed:
+            if name in self.state["mp3"]:
+                mp3_state[name] = self.state["mp3"][name]
+            else:
+                del mp3_state[name]
+
+        # Scanned after converting, so WAVs converted into the samples folder are taken in this batch
+        current = scan(self.samples_dir, ".wav")
+        previous = self.state["samples"]
+        changed, removed = diff(previous, current)
+        template = _stat(self.template_file)
+        template_changed = template != self.state["template"]
+
+        with SampleIndex(self.samples_dir) as sample_index:
+            if changed or removed:
+                summary["trimmed"] = self._trim(changed, removed)
+                summary["indexed"] = self._index(sample_index, changed, removed, first_run=not previous)
+                summary["removed"] = len(removed)
+            self._update_stores(current, changed, removed)
+            self._update_assigner(sample_index, changed, removed)
+            added = [sample_index.info(name) for name in changed if name not in previous]
+            grown = {info["frames"] for info in added if info is not None and info["frames"] is not None}
+            affected = self.affected_presets(changed, removed, grown, template_changed)
+            if affected:
+                summary["presets"] = self._rewrite(affected, sample_index, template_changed)
+
+        # Only once the whole batch went through, so a failure anywhere redoes it
+        self.state["mp3"] = mp3_state
+        self.state["samples"] = current
+        self.state["template"] = template
+        self.save_state()
+        self._failed = {name: current_mp3[name] for name in failed}
+        self._retry_at = self.clock() + RETRY_SECONDS if failed else None
+        self._pending_since = None
+        metrics.inc("watch_batches")
+        print(f"Processed changes in {time.perf_counter() - start:.1f}s: {summary}")
+        return summary
+
+    def _trim(self, changed, removed):
+        os.makedirs(self.trimmed_dir, exist_ok=True)
+        for name in removed:
+            try:
+                os.remove(os.path.join(self.trimmed_dir, name))
+            except FileNotFoundError:
+                pass
+        if not changed:
+            return 0
+        return stripSilence.strip_directory(self.samples_dir, self.trimmed_dir, filenames=changed)["processed"]
+
+    def _index(self, sample_index, changed, removed, first_run):
+        if first_run:
+            sample_index.refresh()  # faster than one transaction per file for a whole library
+        else:
+            for name in changed:
+                try:
+                    sample_index.update(name)
+                except FileNotFoundError:  # removed since the scan; the next batch drops it
+                    pass
+            for name in removed:
+                sample_index.remove(name)
+        return len(changed)
+
+    def _update_stores(self, current, changed, removed):
+        # Every batch, not only those that redraw presets, so no sample is drawn without its fingerprint
+        if not presetgen.REJECT_NEAR_DUPLICATES:
+            self._fingerprints = None
+        elif self._fingerprints is None:
+            self._fingerprints = FingerprintStore(self.samples_dir)
+        if not presetgen.ZONE_ORDER_FEATURE:
+            self._features = None
+        elif self._features is None:
+            self._features = FeatureStore(self.samples_dir)
+        for store in (self._fingerprints, self._features):
+            if store is None:
+                continue
+            for name in removed:
+                store.files.pop(name, None)
+            # Changed files, and any without a result: not seen yet (e.g. from before the option was
+            # turned on) or failed last time (the store records the file even then)
+            names = [name for name in sorted(set(changed).union(n for n in current if store.lookup(n) is None))
+                     if os.path.exists(os.path.join(self.samples_dir, name))]
+            if names or removed:
+                store.update(names)
+
+    def _build_assigner(self, sample_index):
+        conflicts = self._fingerprints.conflicts if self._fingerprints is not None else None
+        self._assigner = make_assigner(sample_index, conflicts, self.rng)
+        self._frames = {name: frames for frames, names in sample_index.length_groups(min_size=1).items()
+                        for name in names}
+        self._lengths = {}
+        for frames in self._frames.values():
+            self._lengths[frames] = self._lengths.get(frames, 0) + 1
+
+    def _update_assigner(self, sample_index, changed, removed):
+        # Applies this batch's changes to the kept assigner, so a batch costs what changed, not the library
+        assigner = self._assigner
+        if assigner is None:
+            return  # built on the first rewrite, from the index as it is then
+        assigner.conflicts = self._fingerprints.conflicts if self._fingerprints is not None else None
+        for name in list(changed) + list(removed):
+            frames = self._frames.pop(name, None)
+            if frames is not None:
+                self._lengths[frames] -= 1
+                if not self._lengths[frames]:
+                    del self._lengths[frames]
+            assigner.remove(name)
+        for name in changed:
+            info = sample_index.info(name)
+            if info is None or info["frames"] is None:
+                continue
+            frames = self._frames[name] = info["frames"]
+            self._lengths[frames] = self._lengths.get(frames, 0) + 1
+            assigner.add(name, frames if assigner.distinct_groups else None)
+        # make_assigner's choice between same-length groups and one pool, kept in step with the library
+        if (sum(count >= 8 for count in self._lengths.values()) >= 8) != assigner.distinct_groups:
+            self._build_assigner(sample_index)
+
+    def affected_presets(self, changed, removed, grown_groups, template_changed=False):
+        """Numbers of the presets that have to be drawn again (see the class docstring)."""
+        touched = set(changed) | set(removed)
+        affected = []
+        for number in range(1, self.num_presets + 1):
+            entry = self.state["presets"].get(str(number))
+            if (template_changed or entry is None
+                    or not os.path.exists(os.path.join(self.presets_dir, f"prst{number:03d}.yml"))
+                    or any(sample in touched for bank in entry["banks"] for sample in bank)
+                    or grown_groups.intersection(entry["groups"])):
+                affected.append(number)
+        return affected
+
+    def _rewrite(self, numbers, sample_index, template_changed):
+        if self._template is None or template_changed:
+            _, self._template = load_template(self.template_file)
+        if self._assigner is None:
+            self._build_assigner(sample_index)
+        assigner = self._assigner
+        feature_store = self._features
+
+        if not assigner.total_samples:
+            print(f"No samples in {self.samples_dir} to build presets from.")
+            return 0
+        os.makedirs(self.presets_dir, exist_ok=True)
+        for number in numbers:
+            banks = order_zones(assigner.assign_preset(), feature_store)
+            output_file = os.path.join(self.presets_dir, f"prst{number:03d}.yml")
+            build_preset(number, self._template, banks).save(output_file)
+            # A channel's pool is its same-length group; without groups there is only the one pool
+            groups = ([self._frames.get(bank[0]) for bank in banks] if assigner.distinct_groups
+                      else [None] * len(banks))
+            self.state["presets"][str(number)] = {"banks": banks, "groups": groups}
+            print(f"Preset {number} saved to {output_file}")
+        metrics.inc("watch_presets", len(numbers))
+        return len(numbers)
+
+    def run(self, interval=POLL_INTERVAL):
+        """Poll every `interval` seconds and process each settled burst of changes until interrupted."""
+        print(f"Watching {self.mp3_dir} and {self.samples_dir} (Ctrl-C to stop)")
+        try:
+            while True:
+                if self.poll():
+                    try:
+                        self.process()
+                    except Exception as e:
+                        # Keep watching; the batch is retried once the folders settle again
+                        print(f"Error processing changes: {e}")
+                        self._changed_at = self.clock()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Watch the sample folders and keep WAVs, index and presets up to date.")
+    parser.add_argument("--mp3-dir", default=MP3_DIR)
+    parser.add_argument("--converted-dir", help="where converted WAVs go (default: the MP3 folder)")
+    parser.add_argument("--samples-dir", default=SAMPLES_DIR)
+    parser.add_argument("--trimmed-dir", default=TRIMMED_DIR)
+    parser.add_argument("--presets-dir", default=PRESETS_DIR)
+    parser.add_argument("--template", default=TEMPLATE_FILE)
+    parser.add_argument("--num-presets", type=int, default=NUM_PRESETS)
+    parser.add_argument("--seed", type=int, default=presetgen.SEED)
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="seconds between scans")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS)
+    parser.add_argument("--once", action="store_true", help="process what changed since the last run, then exit")
+    args = parser.parse_args(argv)
+    args.converted_dir = args.converted_dir or args.mp3_dir
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    watcher = Watcher(args.mp3_dir, args.converted_dir, args.samples_dir, args.trimmed_dir, args.presets_dir,
+                      args.template, args.num_presets, args.seed, args.debounce)
+    if args.once:
+        return watcher.process()
+    watcher.run(args.interval)
+
+
+if __name__ == "__main__":
+    with metrics.session("watch"):
+        main()